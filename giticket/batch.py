@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""Validate and normalize commit messages streamed as JSON lines.
+
+Each input line is an object with ``id``, ``message`` and ``branch`` keys.
+Each output line carries the ``id``, the ``status`` (``bailed``,
+``rewrote`` or ``rejected``), the resulting ``message`` and any
+``errors``, in input order.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import argparse
+import functools
+import io
+import json
+import multiprocessing
+import sys
+
+import six
+
+from giticket import patterns
+from giticket import stats
+from giticket.giticket import DEFAULT_REGEX
+from giticket.giticket import CommitMessageError
+from giticket.giticket import normalize_commit_message
+from giticket.giticket import regex_match_mode
+from giticket.giticket import underscore_split_mode
+
+# Records sent to a worker at a time; large enough to amortize the IPC.
+CHUNK_SIZE = 256
+
+
+def invalid_record(record_id, reason):
+    return {'id': record_id, 'status': stats.OUTCOME_REJECTED,
+            'message': None, 'errors': ['INVALID RECORD: {0}'.format(reason)]}
+
+
+def process_record(record, regex, mode):
+    """Run one record through the hook logic and return its result."""
+    message = record.get('message')
+    branch = record.get('branch')
+    if not isinstance(message, six.text_type):
+        return invalid_record(record.get('id'), 'message must be a string')
+    if branch is not None and not isinstance(branch, six.text_type):
+        return invalid_record(record.get('id'), 'branch must be a string or null')
+    # Split lines the way the hook reads COMMIT_EDITMSG.
+    contents = io.StringIO(message, newline=None).readlines()
+    result = {'id': record.get('id')}
+    try:
+        header = normalize_commit_message(contents, regex, mode,
+                                          [] if branch is None else [branch])
+    except CommitMessageError as e:
+        result.update(status=stats.OUTCOME_REJECTED, message=message,
+                      errors=e.errors)
+        return result
+    if header is None:
+        result.update(status=stats.OUTCOME_BAILED, message=message, errors=[])
+    else:
+        contents[0] = header + '\n'
+        result.update(status=stats.OUTCOME_REWROTE, message=''.join(contents),
+                      errors=[])
+    return result
+
+
+def process_line(line, regex, mode):
+    """Decode one JSON line, process it and return the encoded result."""
+    try:
+        record = json.loads(line)
+        if not isinstance(record, dict):
+            raise ValueError('expected a JSON object')
+    except ValueError as e:
+        result = invalid_record(None, e)
+    else:
+        result = process_record(record, regex, mode)
+    return json.dumps(result, ensure_ascii=False) + '\n'
+
+
+def iter_results(lines, regex, mode, jobs=1):
+    """Yield the encoded result of each non-blank JSON line, in order."""
+    lines = (line for line in lines if line.strip())
+    process = functools.partial(process_line, regex=regex, mode=mode)
+    if jobs <= 1:
+        for line in lines:
+            yield process(line)
+        return
+    pool = multiprocessing.Pool(jobs)
+    try:
+        for result in pool.imap(process, lines, CHUNK_SIZE):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='giticket batch')
+    parser.add_argument('--regex', default=DEFAULT_REGEX)
+    parser.add_argument('--mode', nargs='?', const=underscore_split_mode,
+                        default=underscore_split_mode,
+                        choices=[underscore_split_mode, regex_match_mode])
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Worker processes to spread the records over.')
+    args = parser.parse_args(argv)
+    try:
+        regex = patterns.compile_ticket_regex(args.regex)
+    except patterns.UnsafeRegexError as e:
+        sys.stderr.write("UNSAFE REGEX DETECTED: {0}\n".format(e))
+        return 1
+    for result in iter_results(sys.stdin, regex, args.mode, args.jobs):
+        sys.stdout.write(result)
+    return 0
@@ -2,13 +2,24 @@
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
-import argparse
-import io
-import re
-import subprocess
-import sys
+import time
 
-import six
+# Taken before the other imports, so the recorded hook latency includes them.
+_import_time = time.monotonic()
+
+import argparse  # noqa: E402
+import importlib  # noqa: E402
+import io  # noqa: E402
+import os  # noqa: E402
+import re  # noqa: E402
+import subprocess  # noqa: E402
+import sys  # noqa: E402
+
+import six  # noqa: E402
+
+from giticket import patterns  # noqa: E402
+from giticket import scopes  # noqa: E402
+from giticket import stats  # noqa: E402
 
 def find_closest_match(input_str, valid_options):
     """
@@ -59,6 +70,32 @@ def find_closest_match(input_str, valid_options):
 underscore_split_mode = 'underscore_split'
 regex_match_mode = 'regex_match'
 
+DEFAULT_REGEX = r'[A-Z]+-\d+'
+
+# Sources the branch name (and so the ticket) can be resolved from.
+env_resolver = 'env'
+file_resolver = 'file'
+head_resolver = 'head'
+upstream_resolver = 'upstream'
+DEFAULT_RESOLVERS = [env_resolver, file_resolver, head_resolver, upstream_resolver]
+
+# Environment variables CI systems use for the branch being built.
+BRANCH_ENV_VARS = [
+    'GITICKET_BRANCH',
+    'GITHUB_HEAD_REF',
+    'GITHUB_REF_NAME',
+    'CI_MERGE_REQUEST_SOURCE_BRANCH_NAME',
+    'CI_COMMIT_REF_NAME',
+    'BITBUCKET_BRANCH',
+    'CIRCLE_BRANCH',
+    'TRAVIS_PULL_REQUEST_BRANCH',
+    'TRAVIS_BRANCH',
+    'BRANCH_NAME',
+]
+
+# File in the git dir holding a ticket (or branch name) to use instead of HEAD.
+TICKET_FILENAME = 'giticket-ticket'
+
 # Allowed commit types (always converted to lowercase)
 ALLOWED_TYPES = [
     'build',
@@ -81,83 +118,187 @@ ALLOWED_SCOPES = [
 ]
 
 
-def update_commit_message(filename, regex, mode, format_string):
+class CommitMessageError(Exception):
+    """The commit message was rejected; ``errors`` holds one line per problem."""
+
+    def __init__(self, errors):
+        super(CommitMessageError, self).__init__('\n'.join(errors))
+        self.errors = errors
+
+
+def update_commit_message(filename, regex, mode, format_string,
+                          resolvers=DEFAULT_RESOLVERS,
+                          scope_map=scopes.SCOPE_MAP_FILENAME):
+    """Validate the commit message in filename and add the branch ticket to it.
+
+    The branch name is looked up through ``resolvers`` only once the message
+    actually needs a ticket. A missing scope is inferred from the staged
+    paths using ``scope_map``. Returns True if the file was rewritten.
+    """
     with io.open(filename, 'r+') as fd:
         contents = fd.readlines()
-        commit_msg = contents[0].rstrip('\r\n')
-        # Check if we can grab ticket info from branch name.
-        branch = get_branch_name()
+        branches = iter_branch_names(resolvers, get_hook_git_dir(filename))
+        header = None
+        try:
+            header = normalize_commit_message(contents, regex, mode, branches,
+                                              scope_map)
+        except CommitMessageError as e:
+            for error in e.errors:
+                sys.stderr.write(error + "\n")
+            sys.exit(1)
+        if header is None:
+            return False
+        return rewrite_header(fd, contents, header)
+
+
+def normalize_commit_message(contents, regex, mode, branches, scope_map=None):
+    """Return the new first line for the commit message lines in contents, or
+    None if the message should be left alone.
+
+    ``branches`` is only iterated once the message needs a ticket, and
+    ``scope_map`` is only read when the scope is missing or invalid.
+    Raises CommitMessageError if the message is rejected.
+    """
+    if not contents:
+        return None
+    commit_msg = contents[0].rstrip('\r\n')
 
-        # Bail if commit message starts with "fixup!", "Merge branch", "Merge pull request"
-        # or commit message already contains tickets
-        if commit_msg.startswith('fixup!') or commit_msg.startswith('Merge branch') or commit_msg.startswith('Merge pull request'):
-            return
+    # Bail if commit message starts with "fixup!", "Merge branch", "Merge pull request"
+    # or commit message already contains tickets
+    if commit_msg.startswith('fixup!') or commit_msg.startswith('Merge branch') or commit_msg.startswith('Merge pull request'):
+        return None
 
-        # Parse commit message for conventional commit structure regardless of ticket presence
-        # Expected format: "type(scope): message"
-        type_scope_pattern = r'^([a-zA-Z]+)\(([a-zA-Z0-9]+)\):\s*(.*)$'
-        match_res = re.match(type_scope_pattern, commit_msg)
-
-        if match_res:
-            # Extract parts from the regex match
-            commit_type = match_res.group(1).lower()  # Convert type to lowercase
-            commit_scope = match_res.group(2).upper()  # Convert scope to uppercase
-            commit_message = match_res.group(3)
-
-            # Collect validation errors
-            errors = []
-
-            # Validate commit type
-            if commit_type not in ALLOWED_TYPES:
-                # Try to find a similar type to suggest
-                suggested_type = find_closest_match(commit_type, ALLOWED_TYPES)
-                if suggested_type:
-                    errors.append(f"Do you mean `{suggested_type}` instead of `{commit_type}`?")
-                errors.append(f"WRONG TYPE DETECTED: Invalid commit type '{commit_type}'. Allowed types are: {', '.join(ALLOWED_TYPES)}")
-
-            # Validate commit scope
-            if commit_scope not in ALLOWED_SCOPES:
-                # Try to find a similar scope to suggest
-                suggested_scope = find_closest_match(commit_scope, ALLOWED_SCOPES)
-                if suggested_scope:
-                    errors.append(f"Do you mean `{suggested_scope}` instead of `{commit_scope}`?")
-                errors.append(f"WRONG SCOPE DETECTED: Invalid commit scope '{commit_scope}'. Allowed scopes are: {', '.join(ALLOWED_SCOPES)}")
-
-            # If there are any errors, display them and exit
-            if errors:
-                for error in errors:
-                    sys.stderr.write(error + "\n")
-                sys.exit(1)
-
-            # If commit message already contains tickets, don't modify it
-            if any(re.search(regex, content) for content in contents):
-                return
-
-        tickets = re.findall(regex, branch)
-        if tickets:
-            if mode == underscore_split_mode:
-                tickets = [branch.split(six.text_type('_'))[0]]
-            tickets = [t.strip() for t in tickets]
-
-            if match_res:
-                # Format as conventional commit: type(scope): ticket message
-                new_commit_msg = "{type}({scope}): {ticket} {message}".format(
-                    type=commit_type,
-                    scope=commit_scope,
-                    ticket=tickets[0],
-                    message=commit_message
-                )
-            else:
-                # If the format doesn't match, inform the user about the expected format
-                sys.stderr.write("WRONG FORMAT DETECTED: Commit message must follow the format 'type(scope): message'\n")
-                sys.stderr.write(f"Allowed types: {', '.join(ALLOWED_TYPES)}\n")
-                sys.stderr.write(f"Allowed scopes: {', '.join(ALLOWED_SCOPES)}\n")
-                sys.exit(1)
-
-            contents[0] = six.text_type(new_commit_msg + "\n")
-            fd.seek(0)
-            fd.writelines(contents)
-            fd.truncate()
+    # Reject ticket regexes that could hang the commit
+    try:
+        ticket_regex = patterns.compile_ticket_regex(regex)
+    except patterns.UnsafeRegexError as e:
+        raise CommitMessageError([f"UNSAFE REGEX DETECTED: {e}"])
+
+    # Parse commit message for conventional commit structure regardless of ticket presence
+    # Expected format: "type(scope): message"
+    type_scope_pattern = r'^([a-zA-Z]+)\(([a-zA-Z0-9]+)\):\s*(.*)$'
+    match_res = re.match(type_scope_pattern, commit_msg)
+
+    # Fill in the scope from the staged paths when it was left out
+    scope_inferred = False
+    if not match_res:
+        filled_msg = fill_in_scope(commit_msg, scope_map)
+        if filled_msg:
+            commit_msg = filled_msg
+            match_res = re.match(type_scope_pattern, commit_msg)
+            scope_inferred = True
+
+    if match_res:
+        # Extract parts from the regex match
+        commit_type = match_res.group(1).lower()  # Convert type to lowercase
+        commit_scope = match_res.group(2).upper()  # Convert scope to uppercase
+        commit_message = match_res.group(3)
+
+        # Collect validation errors
+        errors = []
+
+        # Validate commit type
+        if commit_type not in ALLOWED_TYPES:
+            # Try to find a similar type to suggest
+            suggested_type = find_closest_match(commit_type, ALLOWED_TYPES)
+            if suggested_type:
+                errors.append(f"Do you mean `{suggested_type}` instead of `{commit_type}`?")
+            errors.append(f"WRONG TYPE DETECTED: Invalid commit type '{commit_type}'. Allowed types are: {', '.join(ALLOWED_TYPES)}")
+
+        # Validate commit scope
+        if commit_scope not in ALLOWED_SCOPES:
+            # Try to find a similar scope to suggest
+            suggested_scope = find_closest_match(commit_scope, ALLOWED_SCOPES)
+            if suggested_scope:
+                errors.append(f"Do you mean `{suggested_scope}` instead of `{commit_scope}`?")
+            staged_scope = get_staged_scope(scope_map)
+            if staged_scope in ALLOWED_SCOPES and staged_scope != suggested_scope:
+                errors.append(f"The staged files suggest scope `{staged_scope}`.")
+            errors.append(f"WRONG SCOPE DETECTED: Invalid commit scope '{commit_scope}'. Allowed scopes are: {', '.join(ALLOWED_SCOPES)}")
+
+        # If there are any errors, reject the message
+        if errors:
+            raise CommitMessageError(errors)
+
+        normalized_msg = "{type}({scope}): {message}".format(
+            type=commit_type,
+            scope=commit_scope,
+            message=commit_message
+        )
+
+        # If commit message already contains tickets, only keep an inferred scope.
+        # An inferred scope counts as typed, so check the header with it.
+        lines = contents
+        if scope_inferred:
+            lines = [normalized_msg + "\n"] + contents[1:]
+        try:
+            if ticket_regex.search_lines(lines):
+                return normalized_msg if scope_inferred else None
+        except patterns.RegexTimeoutError as e:
+            raise CommitMessageError([regex_timeout_error(ticket_regex.pattern, e)])
+
+    # Check if we can grab ticket info from branch name.
+    try:
+        tickets = find_tickets(ticket_regex, mode, branches)
+    except patterns.RegexTimeoutError as e:
+        raise CommitMessageError([regex_timeout_error(ticket_regex.pattern, e)])
+    if tickets:
+        if not match_res:
+            # If the format doesn't match, inform the user about the expected format
+            raise CommitMessageError([
+                "WRONG FORMAT DETECTED: Commit message must follow the format 'type(scope): message'",
+                f"Allowed types: {', '.join(ALLOWED_TYPES)}",
+                f"Allowed scopes: {', '.join(ALLOWED_SCOPES)}",
+            ])
+
+        # Format as conventional commit: type(scope): ticket message
+        return "{type}({scope}): {ticket} {message}".format(
+            type=commit_type,
+            scope=commit_scope,
+            ticket=tickets[0],
+            message=commit_message
+        )
+
+    return normalized_msg if scope_inferred else None
+
+
+def rewrite_header(fd, contents, header):
+    """Replace the first line of the open commit message file."""
+    contents[0] = six.text_type(header + "\n")
+    fd.seek(0)
+    fd.writelines(contents)
+    fd.truncate()
+    return True
+
+
+def get_staged_scope(scope_map):
+    """Return the scope the staged paths map to, or None."""
+    if scope_map is None:
+        return None
+    try:
+        return scopes.infer_staged_scope(scope_map, ALLOWED_SCOPES)
+    except scopes.ScopeMapError as e:
+        raise CommitMessageError([f"INVALID SCOPE MAP: {scope_map} {e}"])
+    except (subprocess.CalledProcessError, OSError):
+        return None
+
+
+def fill_in_scope(commit_msg, scope_map):
+    """Return a "type: message" header with the staged scope filled in, or
+    None if the header has another shape, an unknown type, or no scope can
+    be inferred.
+    """
+    match_res = re.match(r'^([a-zA-Z]+):\s*(.*)$', commit_msg)
+    if not match_res or match_res.group(1).lower() not in ALLOWED_TYPES:
+        return None
+    scope = get_staged_scope(scope_map)
+    if scope is None:
+        return None
+    return "{type}({scope}): {message}".format(
+        type=match_res.group(1),
+        scope=scope,
+        message=match_res.group(2)
+    )
 
 
 def get_branch_name():
@@ -172,6 +313,175 @@ def get_branch_name():
     ).decode('UTF-8')
 
 
+def read_head_branch(git_dir):
+    """Read the current branch straight from $GIT_DIR/HEAD.
+
+    Returns ``HEAD`` for a detached HEAD, like ``git rev-parse --abbrev-ref``,
+    or None if HEAD cannot be interpreted without git.
+    """
+    try:
+        with io.open(os.path.join(git_dir, 'HEAD')) as fd:
+            head = fd.read().strip()
+    except (IOError, OSError):
+        return None
+    if head == 'ref: refs/heads/.invalid':
+        # Placeholder in reftable repositories, whose real HEAD lives in
+        # $GIT_DIR/reftable.
+        return None
+    if head.startswith('ref: refs/heads/'):
+        return head[len('ref: refs/heads/'):]
+    if re.match(r'^[0-9a-f]{40}([0-9a-f]{24})?$', head):
+        return 'HEAD'
+    return None
+
+
+def get_upstream_branch_name():
+    """Return the name of the upstream branch of HEAD on its remote, without
+    the remote name, or None if there is no upstream.
+    """
+    try:
+        with io.open(os.devnull, 'w') as devnull:
+            ref = subprocess.check_output(
+                [
+                    'git',
+                    'rev-parse',
+                    '--symbolic-full-name',
+                    '@{upstream}',
+                ],
+                stderr=devnull,
+            ).decode('UTF-8').strip()
+    except (subprocess.CalledProcessError, OSError):
+        return None
+    if ref.startswith('refs/remotes/'):
+        # refs/remotes/<remote>/<branch>
+        return ref[len('refs/remotes/'):].partition('/')[2] or None
+    if ref.startswith('refs/heads/'):
+        return ref[len('refs/heads/'):]
+    return ref or None
+
+
+def get_common_git_dir(git_dir):
+    """Return the main git dir shared by the linked worktree at git_dir, or
+    None if git_dir is not a linked worktree.
+    """
+    try:
+        with io.open(os.path.join(git_dir, 'commondir')) as fd:
+            common_dir = fd.read().strip()
+    except (IOError, OSError):
+        return None
+    return os.path.normpath(os.path.join(git_dir, common_dir))
+
+
+def branch_from_env(git_dir):
+    for name in BRANCH_ENV_VARS:
+        value = os.environ.get(name)
+        if value:
+            yield value
+
+
+def branch_from_ticket_file(git_dir):
+    if git_dir is None:
+        return
+    # A linked worktree's own ticket file wins over the main repository's.
+    for directory in (git_dir, get_common_git_dir(git_dir)):
+        if directory is None:
+            continue
+        try:
+            with io.open(os.path.join(directory, TICKET_FILENAME)) as fd:
+                value = fd.read().strip()
+        except (IOError, OSError):
+            continue
+        if value:
+            yield value
+            return
+
+
+def branch_from_head(git_dir):
+    branch = read_head_branch(git_dir) if git_dir else None
+    yield branch if branch is not None else get_branch_name()
+
+
+def branch_from_upstream(git_dir):
+    branch = get_upstream_branch_name()
+    if branch:
+        yield branch
+
+
+RESOLVERS = {
+    env_resolver: branch_from_env,
+    file_resolver: branch_from_ticket_file,
+    head_resolver: branch_from_head,
+    upstream_resolver: branch_from_upstream,
+}
+
+
+def iter_branch_names(resolvers, git_dir):
+    """Lazily yield candidate branch names from each resolver in order."""
+    for name in resolvers:
+        for branch in RESOLVERS[name](git_dir):
+            yield branch
+
+
+def find_tickets(regex, mode, branches):
+    """Return the tickets of the first branch name the regex matches.
+
+    Later branch names are never resolved once a ticket is found.
+    """
+    ticket_regex = patterns.compile_ticket_regex(regex)
+    for branch in branches:
+        tickets = ticket_regex.findall(branch)
+        if tickets:
+            if mode == underscore_split_mode:
+                tickets = [branch.split(six.text_type('_'))[0]]
+            return [t.strip() for t in tickets]
+    return []
+
+
+def regex_timeout_error(pattern, error):
+    return f"REGEX TIMEOUT: Ticket regex '{pattern}' is too slow for this message ({error})"
+
+
+def resolver_list(value):
+    resolvers = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in resolvers if name not in RESOLVERS]
+    if unknown or not resolvers:
+        raise argparse.ArgumentTypeError(
+            'invalid resolvers {0!r}, choose from: {1}'.format(
+                value, ', '.join(DEFAULT_RESOLVERS)))
+    return resolvers
+
+
+def get_hook_git_dir(filename):
+    """Return the git dir holding the commit message file, or None.
+
+    Git writes the message to $GIT_DIR/COMMIT_EDITMSG, so this avoids
+    spawning ``git rev-parse`` on every commit.
+    """
+    git_dir = os.path.dirname(os.path.abspath(filename))
+    if os.path.isfile(os.path.join(git_dir, 'HEAD')):
+        return git_dir
+    return None
+
+
+def hook_start_time():
+    """Return when this hook run started: the import of this module for the
+    first run in a process, now for any later one.
+    """
+    global _import_time
+    start, _import_time = _import_time, None
+    return time.monotonic() if start is None else start
+
+
+# Modules providing the ``main`` of each subcommand, imported on demand so
+# they don't slow down the hook itself.
+SUBCOMMANDS = {
+    'batch': 'giticket.batch',
+    'report': 'giticket.report',
+    'scope': 'giticket.scopes',
+    'stats': 'giticket.stats',
+}
+
+
 def main(argv=None):
     """This hook saves developers time by prepending ticket numbers to commit-msgs.
     For this to work the following two conditions must be met:
@@ -179,6 +489,11 @@ def main(argv=None):
         - The ticket format regex specified must match.
         - The branch name format must be <ticket number>_<rest of the branch name>
     """
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] in SUBCOMMANDS:
+        return importlib.import_module(SUBCOMMANDS[argv[0]]).main(argv[1:])
+
     parser = argparse.ArgumentParser()
     parser.add_argument('filenames', nargs='+')
     parser.add_argument('--regex')
@@ -186,10 +501,37 @@ def main(argv=None):
     parser.add_argument('--mode', nargs='?', const=underscore_split_mode,
                         default=underscore_split_mode,
                         choices=[underscore_split_mode, regex_match_mode])
+    parser.add_argument('--resolvers', type=resolver_list,
+                        help='Comma-separated sources to look up the ticket '
+                             'from, in order. Defaults to '
+                             '{0}.'.format(','.join(DEFAULT_RESOLVERS)))
+    parser.add_argument('--scope-map',
+                        help='File mapping path prefixes to scopes, used when '
+                             'the scope is left out. Defaults to '
+                             '{0}.'.format(scopes.SCOPE_MAP_FILENAME))
     args = parser.parse_args(argv)
-    regex = args.regex or r'[A-Z]+-\d+'  # noqa
+    regex = args.regex or DEFAULT_REGEX
     format_string = args.format or '{ticket} {commit_msg}' # noqa
-    update_commit_message(args.filenames[0], regex, args.mode, format_string)
+    resolvers = args.resolvers or DEFAULT_RESOLVERS
+    scope_map = args.scope_map or scopes.SCOPE_MAP_FILENAME
+    start = hook_start_time()
+    outcome = stats.OUTCOME_BAILED
+    try:
+        if update_commit_message(args.filenames[0], regex, args.mode,
+                                 format_string, resolvers, scope_map):
+            outcome = stats.OUTCOME_REWROTE
+    except SystemExit:
+        outcome = stats.OUTCOME_REJECTED
+        raise
+    except BaseException:
+        # A crash is not a timing of any outcome.
+        outcome = None
+        raise
+    finally:
+        git_dir = get_hook_git_dir(args.filenames[0])
+        if git_dir and outcome is not None:
+            stats.record_hook_latency(git_dir, outcome,
+                                      time.monotonic() - start)
 
 
 if __name__ == '__main__':
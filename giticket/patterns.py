@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""Guard rails for the user supplied ``--regex`` ticket pattern.
+
+A pattern is rejected up front if it nests quantifiers, and the common
+ticket shapes (``[A-Z]+-\\d+``, ``\\d{4,}``, ``PROJ-[0-9]+``...) are
+matched through a rewritten pattern that cannot backtrack, so hook latency
+stays linear in the input size. Any other pattern matches under a time budget.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import contextlib
+import re
+import signal
+import threading
+
+try:
+    from re import _constants as sre_constants
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+# Wall time, in seconds, a single match with a backtracking pattern may take.
+MATCH_BUDGET = 0.5
+
+# Ranges wider than this are left to the regular engine.
+MAX_CLASS_RANGE = 256
+
+_REPEATS = (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT)
+_POSSESSIVE_REPEAT = getattr(sre_constants, 'POSSESSIVE_REPEAT', None)
+_ATOMIC_GROUP = getattr(sre_constants, 'ATOMIC_GROUP', None)
+
+_CATEGORIES = {
+    sre_constants.CATEGORY_DIGIT: ('\\d', lambda c: c.isdecimal()),
+    sre_constants.CATEGORY_WORD: ('\\w', lambda c: c.isalnum() or c == '_'),
+    sre_constants.CATEGORY_SPACE: ('\\s', lambda c: c.isspace()),
+}
+# Category pairs that share characters.
+_OVERLAPPING_CATEGORIES = set([
+    (sre_constants.CATEGORY_DIGIT, sre_constants.CATEGORY_WORD),
+    (sre_constants.CATEGORY_WORD, sre_constants.CATEGORY_DIGIT),
+])
+
+
+class UnsafeRegexError(ValueError):
+    """The pattern can backtrack catastrophically."""
+
+
+class RegexTimeoutError(RuntimeError):
+    """A match ran over its time budget."""
+
+
+def _subpatterns(op, av):
+    """Return the nested subpatterns of a parsed regex item."""
+    if op in _REPEATS or op == _POSSESSIVE_REPEAT:
+        return [av[2]]
+    if op == sre_constants.SUBPATTERN:
+        return [av[-1]]
+    if op == sre_constants.BRANCH:
+        return list(av[1])
+    if op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+        return [av[1]]
+    if op == sre_constants.GROUPREF_EXISTS:
+        return [p for p in av[1:] if p is not None]
+    if op == _ATOMIC_GROUP:
+        return [av]
+    return []
+
+
+def _is_variable_repeat(op, av):
+    return op in _REPEATS and av[0] != av[1]
+
+
+def _variable_repeats(subpattern):
+    """Yield the body of every repeat in subpattern that can match a varying
+    number of times. Fixed counts like ``\\d{3}`` cannot backtrack.
+    """
+    for op, av in subpattern:
+        if _is_variable_repeat(op, av):
+            yield av[2]
+        for p in _subpatterns(op, av):
+            for body in _variable_repeats(p):
+                yield body
+
+
+def _is_delimited(subpattern):
+    """Return True if subpattern starts with a literal none of its repeats
+    can match, as in ``(?:,[A-Z]+-\\d+)``, so consecutive matches of it can
+    only split one way.
+    """
+    if not subpattern or subpattern[0][0] != sre_constants.LITERAL:
+        return False
+    delimiter = _CharClass([chr(subpattern[0][1])])
+    for body in _variable_repeats(subpattern):
+        char_class = _char_class(*body[0]) if len(body) == 1 else None
+        if char_class is None or not char_class.isdisjoint(delimiter):
+            return False
+    return True
+
+
+def find_nested_quantifier(subpattern):
+    """Return True if a repeated item itself contains a repeat, as in
+    ``(a+)+`` or ``(?:[A-Z]+-?)*``.
+
+    Fixed-count inner repeats and bodies delimited by a leading literal,
+    like ``(?:\\d{3}-)+`` or ``(?:,[A-Z]+-\\d+)*``, are safe.
+    """
+    for op, av in subpattern:
+        if (op in _REPEATS and av[1] > 1 and not _is_delimited(av[2]) and
+                any(True for _ in _variable_repeats(av[2]))):
+            return True
+        if any(find_nested_quantifier(p) for p in _subpatterns(op, av)):
+            return True
+    return False
+
+
+class _CharClass(object):
+    """A set of characters matched by a single regex item."""
+
+    def __init__(self, chars=(), categories=()):
+        self.chars = frozenset(chars)
+        self.categories = frozenset(categories)
+
+    def isdisjoint(self, other):
+        if not self.chars.isdisjoint(other.chars):
+            return False
+        for category in self.categories:
+            if category in other.categories:
+                return False
+            if any(other.contains_category(category, c) for c in other.chars):
+                return False
+            if any((category, o) in _OVERLAPPING_CATEGORIES for o in other.categories):
+                return False
+        for category in other.categories:
+            if any(self.contains_category(category, c) for c in self.chars):
+                return False
+        return True
+
+    @staticmethod
+    def contains_category(category, char):
+        return _CATEGORIES[category][1](char)
+
+    def to_regex(self):
+        parts = [re.escape(c) for c in sorted(self.chars)]
+        parts.extend(_CATEGORIES[c][0] for c in sorted(self.categories))
+        return '[{0}]'.format(''.join(parts))
+
+
+def _char_class(op, av):
+    """Convert a single-character regex item to a _CharClass, or None."""
+    if op == sre_constants.LITERAL:
+        return _CharClass([chr(av)])
+    if op != sre_constants.IN:
+        return None
+    chars = []
+    categories = []
+    for item_op, item_av in av:
+        if item_op == sre_constants.LITERAL:
+            chars.append(chr(item_av))
+        elif item_op == sre_constants.RANGE:
+            low, high = item_av
+            if high - low > MAX_CLASS_RANGE:
+                return None
+            chars.extend(chr(c) for c in range(low, high + 1))
+        elif item_op == sre_constants.CATEGORY and item_av in _CATEGORIES:
+            categories.append(item_av)
+        else:
+            return None
+    return _CharClass(chars, categories)
+
+
+def _atoms(subpattern):
+    """Split a pattern into (char class, min, max) atoms, or return None if it
+    is not a plain sequence of repeated character classes.
+    """
+    atoms = []
+    for op, av in subpattern:
+        low = high = 1
+        if op in _REPEATS:
+            low, high, body = av
+            if op != sre_constants.MAX_REPEAT or len(body) != 1:
+                return None
+            op, av = body[0]
+        char_class = _char_class(op, av)
+        if char_class is None or low < 1:
+            return None
+        atoms.append((char_class, low, high))
+    return atoms or None
+
+
+def linear_pattern(pattern):
+    """Return an equivalent pattern that matches in linear time, or None.
+
+    This applies to sequences of character classes where every variable
+    length class is disjoint from the next one, so the regex engine can
+    never give characters back. When the first class is unbounded, a
+    negative lookbehind skips start positions inside a run of it, which
+    could only fail again the same way.
+    """
+    parsed = sre_parse.parse(pattern)
+    if parsed.state.flags & ~sre_constants.SRE_FLAG_UNICODE:
+        return None
+    atoms = _atoms(parsed)
+    if atoms is None:
+        return None
+    for (char_class, low, high), (next_class, _, _) in zip(atoms, atoms[1:]):
+        if low != high and not char_class.isdisjoint(next_class):
+            return None
+    first_class, _, first_high = atoms[0]
+    if first_high != sre_constants.MAXREPEAT:
+        return pattern
+    # A match ending inside a run of the first class could be followed by a
+    # match starting in the same run, which the lookbehind would hide.
+    if len(atoms) > 1 and not atoms[-1][0].isdisjoint(first_class):
+        return None
+    return '(?<!{0})(?:{1})'.format(first_class.to_regex(), pattern)
+
+
+class _Progress(object):
+    """Counts the matches finished inside a match_budget block."""
+
+    def __init__(self):
+        self.matches = 0
+
+
+@contextlib.contextmanager
+def match_budget(seconds):
+    """Raise RegexTimeoutError if a single match in the block runs longer
+    than seconds.
+
+    The block bumps the ``matches`` count of the yielded progress after each
+    match. A SIGALRM timer ticks every ``seconds`` and gives up when no match
+    finished since the previous tick, so a match is stopped after one to two
+    budgets while any number of quick matches may run. The regex engine
+    checks for signals while matching, so the handler can interrupt it.
+    Without setitimer, or off the main thread, the block runs unbounded.
+    """
+    progress = _Progress()
+    if (not seconds or not hasattr(signal, 'setitimer') or
+            threading.current_thread() is not threading.main_thread()):
+        yield progress
+        return
+
+    seen = [None]
+
+    def on_timeout(signum, frame):
+        if progress.matches == seen[0]:
+            raise RegexTimeoutError(
+                'match took longer than {0}s'.format(seconds))
+        seen[0] = progress.matches
+
+    previous = signal.signal(signal.SIGALRM, on_timeout)
+    signal.setitimer(signal.ITIMER_REAL, seconds, seconds)
+    try:
+        yield progress
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+class TicketPattern(object):
+    """A checked ticket regex with the same findall/search results as re."""
+
+    def __init__(self, pattern, budget=MATCH_BUDGET):
+        self.pattern = pattern
+        self.budget = budget
+        self.regex = re.compile(pattern)
+        if find_nested_quantifier(sre_parse.parse(pattern)):
+            raise UnsafeRegexError(
+                '{0!r} nests quantifiers and can backtrack '
+                'catastrophically'.format(pattern))
+        linear = linear_pattern(pattern)
+        self.linear = re.compile(linear) if linear is not None else None
+
+    @property
+    def matcher(self):
+        return self.linear or self.regex
+
+    def watchdog(self):
+        """Return a match_budget bounding the time spent on each match.
+
+        The linear rewrite cannot backtrack, so it needs no watchdog.
+        """
+        return match_budget(None if self.linear else self.budget)
+
+    def findall(self, text):
+        with self.watchdog():
+            return self.matcher.findall(text)
+
+    def search(self, text):
+        with self.watchdog():
+            return self.matcher.search(text)
+
+    def search_lines(self, lines):
+        """Return the first match in any of lines, or None.
+
+        Each line gets its own time budget, but the watchdog is only set up
+        once, so long messages don't pay for it on every line.
+        """
+        search = self.matcher.search
+        with self.watchdog() as progress:
+            for line in lines:
+                match = search(line)
+                if match:
+                    return match
+                progress.matches += 1
+        return None
+
+
+def compile_ticket_regex(pattern):
+    """Return a TicketPattern for pattern, which may already be compiled."""
+    if isinstance(pattern, TicketPattern):
+        return pattern
+    return TicketPattern(pattern)
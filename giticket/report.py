@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""Report how commit types and scopes are used across a range of history.
+
+Headers are parsed into columnar arrays of small integer codes, one array
+per column, so counting by any combination of columns is a single
+``Counter`` pass over zipped arrays instead of a loop over commits.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import argparse
+import array
+import collections
+import csv
+import functools
+import itertools
+import re
+import subprocess
+import sys
+
+from giticket.giticket import ALLOWED_SCOPES
+
+COLUMNS = ('type', 'scope', 'author', 'month', 'kind')
+
+KIND_CONVENTIONAL = 'conventional'
+KIND_FIXUP = 'fixup'
+KIND_MERGE = 'merge'
+KIND_OTHER = 'other'
+
+# Shown for a missing type or scope.
+MISSING = '-'
+
+_FIELD_SEP = '\x1f'
+_HEADER_PATTERN = re.compile(
+    r'^(?P<fixup>(?:fixup|squash|amend)! )?'
+    r'(?P<type>[a-zA-Z]+)(?:\((?P<scope>[a-zA-Z0-9]+)\))?!?:')
+
+# Bytes read from git, and records parsed, at a time.
+_READ_SIZE = 1 << 20
+_BATCH_SIZE = 1 << 16
+
+# Longest "type(scope)" prefix worth caching.
+_MAX_PREFIX = 32
+
+
+def classify_header(header):
+    """Return the (type, scope, kind) of a commit header."""
+    if header.startswith('Merge '):
+        return MISSING, MISSING, KIND_MERGE
+    prefix, colon, _ = header.partition(':')
+    if colon and len(prefix) <= _MAX_PREFIX:
+        # Headers share a handful of "type(scope):" prefixes.
+        return _classify_prefix(prefix + colon)
+    return _classify_prefix.__wrapped__(header)
+
+
+@functools.lru_cache(maxsize=4096)
+def _classify_prefix(header):
+    match = _HEADER_PATTERN.match(header)
+    if not match:
+        kind = KIND_FIXUP if header.startswith(('fixup!', 'squash!', 'amend!')) else KIND_OTHER
+        return MISSING, MISSING, kind
+    kind = KIND_FIXUP if match.group('fixup') else KIND_CONVENTIONAL
+    scope = match.group('scope')
+    return (match.group('type').lower(),
+            scope.upper() if scope else MISSING,
+            kind)
+
+
+class HeaderColumns(object):
+    """Commit attributes stored column by column as interned integer codes."""
+
+    def __init__(self):
+        self.codes = {column: array.array('I') for column in COLUMNS}
+        self.values = {column: [] for column in COLUMNS}
+        self._index = {column: {} for column in COLUMNS}
+
+    def __len__(self):
+        return len(self.codes[COLUMNS[0]])
+
+    def extend(self, rows):
+        """Append rows given as one sequence of values per column."""
+        for column, values in zip(COLUMNS, rows):
+            index = self._index[column]
+            for value in dict.fromkeys(values):
+                if value not in index:
+                    index[value] = len(index)
+                    self.values[column].append(value)
+            self.codes[column].extend(map(index.__getitem__, values))
+
+    def count(self, by):
+        """Return [(values, count)] grouped by the given columns, most
+        common first.
+        """
+        counts = collections.Counter(zip(*(self.codes[column] for column in by)))
+        rows = [
+            (tuple(self.values[column][code] for column, code in zip(by, key)), count)
+            for key, count in counts.items()
+        ]
+        rows.sort(key=lambda row: (-row[1], row[0]))
+        return rows
+
+    def distinct(self, column):
+        return set(self.values[column])
+
+
+def parse_log(records):
+    """Build HeaderColumns from ``author<US>month<US>subject`` records."""
+    columns = HeaderColumns()
+    records = iter(records)
+    while True:
+        batch = [record.split(_FIELD_SEP, 2) for record in itertools.islice(records, _BATCH_SIZE)]
+        if not batch:
+            return columns
+        authors, months, headers = zip(*batch)
+        types, scopes, kinds = zip(*map(classify_header, headers))
+        columns.extend((types, scopes, authors, months, kinds))
+
+
+def iter_log_records(revision_range):
+    """Stream ``git log`` records for revision_range without buffering the
+    whole history.
+    """
+    process = subprocess.Popen(
+        [
+            'git',
+            'log',
+            '-z',
+            '--date=format:%Y-%m',
+            '--format=%aN%x1f%ad%x1f%s',
+            revision_range,
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    pending = b''
+    try:
+        while True:
+            chunk = process.stdout.read(_READ_SIZE)
+            if not chunk:
+                break
+            records = (pending + chunk).split(b'\0')
+            pending = records.pop()
+            for record in records:
+                yield record.decode('UTF-8', 'replace')
+        if pending:
+            yield pending.decode('UTF-8', 'replace')
+    finally:
+        process.stdout.close()
+        error = process.stderr.read()
+        process.stderr.close()
+        process.wait()
+    # Only reached once the whole log was read, so this never hides another
+    # exception or fires when the caller stops early.
+    if process.returncode:
+        raise subprocess.CalledProcessError(
+            process.returncode, 'git log', stderr=error)
+
+
+def write_table(out, header, rows):
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+    for row in [header] + rows:
+        out.write('  '.join(
+            cell.rjust(width) if i == len(row) - 1 else cell.ljust(width)
+            for i, (cell, width) in enumerate(zip(row, widths))
+        ).rstrip() + '\n')
+
+
+def column_list(value):
+    columns = [column.strip() for column in value.split(',') if column.strip()]
+    unknown = [column for column in columns if column not in COLUMNS]
+    if unknown or not columns:
+        raise argparse.ArgumentTypeError(
+            'invalid columns {0!r}, choose from: {1}'.format(value, ', '.join(COLUMNS)))
+    return columns
+
+
+def main(argv=None):
+    """Print commit counts grouped by type, scope, author, month or kind."""
+    parser = argparse.ArgumentParser(prog='giticket report')
+    parser.add_argument('revision_range', nargs='?', default='HEAD')
+    parser.add_argument('--by', type=column_list, default=['type', 'scope'],
+                        help='Comma-separated columns to group by, from: '
+                             '{0}. Defaults to type,scope.'.format(', '.join(COLUMNS)))
+    parser.add_argument('--csv', action='store_true',
+                        help='Write CSV instead of a table.')
+    parser.add_argument('--unused-scopes', action='store_true',
+                        help='List the allowed scopes no commit in the range uses.')
+    args = parser.parse_args(argv)
+
+    try:
+        columns = parse_log(iter_log_records(args.revision_range))
+    except subprocess.CalledProcessError as e:
+        message = (e.stderr or b'').decode('UTF-8', 'replace').strip().splitlines()
+        sys.stderr.write('GIT LOG FAILED: {0}\n'.format(
+            message[0] if message else 'exit status {0}'.format(e.returncode)))
+        return 1
+    except OSError as e:
+        sys.stderr.write('GIT LOG FAILED: {0}\n'.format(e))
+        return 1
+    if args.unused_scopes:
+        used = columns.distinct('scope')
+        for scope in ALLOWED_SCOPES:
+            if scope not in used:
+                sys.stdout.write(scope + '\n')
+        return 0
+
+    header = list(args.by) + ['count']
+    rows = [list(values) + [str(count)] for values, count in columns.count(args.by)]
+    if args.csv:
+        writer = csv.writer(sys.stdout, lineterminator='\n')
+        writer.writerow(header)
+        writer.writerows(rows)
+    else:
+        write_table(sys.stdout, header, rows)
+    return 0
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""Infer the commit scope from the staged paths.
+
+The scope map is a text file with one ``<path prefix> <SCOPE>`` pair per
+line, ``#`` starting a comment::
+
+    src/auth/       AUTH
+    src/ui          UI
+    docs            DOC
+
+Prefixes match whole path components, and the longest matching prefix
+wins. The most common scope across all staged files is the suggestion.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import argparse
+import collections
+import io
+import subprocess
+import sys
+
+SCOPE_MAP_FILENAME = '.giticket-scopes'
+
+# Trie key holding the scope of the prefix ending at that node. Path
+# components are never empty, so it cannot clash with one.
+_SCOPE = ''
+
+
+class ScopeMapError(ValueError):
+    """The scope map file is malformed."""
+
+
+def _components(path):
+    return [part for part in path.split('/') if part and part != '.']
+
+
+def parse_scope_map(lines, allowed_scopes=None):
+    """Return the (prefix, scope) pairs listed in lines.
+
+    Raises ScopeMapError for a scope missing from allowed_scopes, if given.
+    """
+    entries = []
+    for number, line in enumerate(lines, 1):
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        fields = line.split()
+        if len(fields) != 2:
+            raise ScopeMapError(
+                'line {0}: expected "<path prefix> <scope>", got {1!r}'.format(
+                    number, line))
+        scope = fields[1].upper()
+        if allowed_scopes is not None and scope not in allowed_scopes:
+            raise ScopeMapError(
+                'line {0}: unknown scope {1!r}'.format(number, fields[1]))
+        entries.append((fields[0], scope))
+    return entries
+
+
+def build_trie(entries):
+    """Compile (prefix, scope) pairs into a trie of path components."""
+    trie = {}
+    for prefix, scope in entries:
+        node = trie
+        for part in _components(prefix):
+            node = node.setdefault(part, {})
+        node[_SCOPE] = scope
+    return trie
+
+
+def load_scope_map(path, allowed_scopes=None):
+    """Return the scope trie for the map at path, or None if there is none."""
+    try:
+        with io.open(path, encoding='UTF-8') as fd:
+            return build_trie(parse_scope_map(fd, allowed_scopes))
+    except (IOError, OSError):
+        return None
+
+
+def match_path(trie, path):
+    """Return the scope of the longest prefix of path in trie, or None."""
+    node = trie
+    scope = trie.get(_SCOPE)
+    for part in _components(path):
+        node = node.get(part)
+        if node is None:
+            break
+        scope = node.get(_SCOPE, scope)
+    return scope
+
+
+def count_scopes(trie, paths):
+    """Count the scope of each path that has one.
+
+    Staged paths come sorted, so siblings share their directory walk.
+    """
+    counts = collections.Counter()
+    directories = {}
+    for path in paths:
+        directory, _, name = path.rpartition('/')
+        try:
+            node, scope = directories[directory]
+        except KeyError:
+            node = trie
+            scope = trie.get(_SCOPE)
+            for part in _components(directory):
+                node = node.get(part)
+                if node is None:
+                    break
+                scope = node.get(_SCOPE, scope)
+            directories[directory] = node, scope
+        if node is not None and name in node:
+            scope = node[name].get(_SCOPE, scope)
+        if scope is not None:
+            counts[scope] += 1
+    return counts
+
+
+def infer_scope(trie, paths):
+    """Return the most common scope of paths, or None if none match."""
+    counts = count_scopes(trie, paths)
+    if not counts:
+        return None
+    # Break ties alphabetically so the suggestion is stable.
+    return min(counts, key=lambda scope: (-counts[scope], scope))
+
+
+def get_staged_paths():
+    output = subprocess.check_output(
+        [
+            'git',
+            'diff',
+            '--cached',
+            '--name-only',
+            '-z',
+        ],
+    ).decode('UTF-8', 'surrogateescape')
+    # Paths need not be UTF-8; undecodable bytes just won't match a prefix.
+    return [path for path in output.split('\0') if path]
+
+
+def infer_staged_scope(scope_map, allowed_scopes=None):
+    """Return the scope suggested by the staged paths, or None if there is no
+    scope map at scope_map.
+    """
+    trie = load_scope_map(scope_map, allowed_scopes)
+    if trie is None:
+        return None
+    return infer_scope(trie, get_staged_paths())
+
+
+def main(argv=None):
+    """Print the scope suggested for the staged paths."""
+    parser = argparse.ArgumentParser(prog='giticket scope')
+    parser.add_argument('--scope-map', default=SCOPE_MAP_FILENAME)
+    args = parser.parse_args(argv)
+    # Imported here, as giticket.giticket imports this module.
+    from giticket.giticket import ALLOWED_SCOPES
+    try:
+        scope = infer_staged_scope(args.scope_map, ALLOWED_SCOPES)
+    except ScopeMapError as e:
+        sys.stderr.write('INVALID SCOPE MAP: {0} {1}\n'.format(args.scope_map, e))
+        return 1
+    except (subprocess.CalledProcessError, OSError):
+        sys.stderr.write('NOT A GIT REPOSITORY: run giticket scope inside a git repository\n')
+        return 1
+    if scope is None:
+        return 1
+    sys.stdout.write(scope + '\n')
+    return 0
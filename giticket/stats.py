@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import argparse
+import contextlib
+import math
+import os
+import struct
+import subprocess
+import sys
+
+try:
+    import fcntl
+    msvcrt = None
+except ImportError:  # Windows
+    import msvcrt
+    fcntl = None
+
+# Hook invocation outcomes, in the order they are stored on disk.
+OUTCOME_BAILED = 'bailed'
+OUTCOME_REWROTE = 'rewrote'
+OUTCOME_REJECTED = 'rejected'
+OUTCOMES = (OUTCOME_BAILED, OUTCOME_REWROTE, OUTCOME_REJECTED)
+
+HISTOGRAM_FILENAME = 'giticket-latency'
+LOCK_FILENAME = HISTOGRAM_FILENAME + '.lock'
+
+# Log-scale buckets over microseconds: BUCKETS_PER_OCTAVE buckets for every
+# doubling, so each bucket spans ~19% and 128 buckets reach ~71 minutes.
+BUCKETS_PER_OCTAVE = 4
+BUCKET_COUNT = 128
+
+_MAGIC = b'GTKH'
+_VERSION = 1
+_HEADER = struct.Struct('<4sHH')
+_COUNTS = struct.Struct('<{0}Q'.format(len(OUTCOMES) * BUCKET_COUNT))
+HISTOGRAM_SIZE = _HEADER.size + _COUNTS.size
+
+
+def bucket_index(seconds):
+    """Return the histogram bucket for a duration given in seconds."""
+    micros = seconds * 1e6
+    if micros < 1:
+        return 0
+    return min(int(math.log2(micros) * BUCKETS_PER_OCTAVE), BUCKET_COUNT - 1)
+
+
+def bucket_upper_bound(index):
+    """Return the upper bound, in seconds, of the given bucket."""
+    return 2 ** ((index + 1) / BUCKETS_PER_OCTAVE) / 1e6
+
+
+def empty_histogram():
+    return {outcome: [0] * BUCKET_COUNT for outcome in OUTCOMES}
+
+
+def read_histogram(path):
+    """Load a histogram file, returning an empty histogram if it is missing
+    or was written by an incompatible version.
+    """
+    try:
+        with open(path, 'rb') as fd:
+            data = fd.read()
+    except (IOError, OSError):
+        return empty_histogram()
+    if len(data) != HISTOGRAM_SIZE:
+        return empty_histogram()
+    magic, version, buckets = _HEADER.unpack_from(data)
+    if magic != _MAGIC or version != _VERSION or buckets != BUCKET_COUNT:
+        return empty_histogram()
+    counts = _COUNTS.unpack_from(data, _HEADER.size)
+    return {
+        outcome: list(counts[i * BUCKET_COUNT:(i + 1) * BUCKET_COUNT])
+        for i, outcome in enumerate(OUTCOMES)
+    }
+
+
+def write_histogram(path, histogram):
+    """Atomically replace the histogram file at path."""
+    counts = []
+    for outcome in OUTCOMES:
+        counts.extend(histogram[outcome])
+    data = _HEADER.pack(_MAGIC, _VERSION, BUCKET_COUNT) + _COUNTS.pack(*counts)
+    # Imported here, as it adds noticeably to the hook's startup time.
+    import tempfile
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(prefix=HISTOGRAM_FILENAME, dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _lock_file(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+    elif msvcrt is not None:
+        # Retries for up to 10 seconds before raising OSError.
+        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+    else:
+        raise OSError('file locking is not supported on this platform')
+
+
+def _unlock_file(fd):
+    # flock locks are released when the file is closed.
+    if fcntl is None and msvcrt is not None:
+        try:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        except (IOError, OSError):
+            pass
+
+
+@contextlib.contextmanager
+def histogram_lock(git_dir):
+    """Hold an exclusive lock on the histogram in git_dir for the block.
+
+    Yields False, without locking, if the lock cannot be taken.
+    """
+    try:
+        fd = os.open(os.path.join(git_dir, LOCK_FILENAME),
+                     os.O_RDWR | os.O_CREAT, 0o644)
+    except (IOError, OSError):
+        yield False
+        return
+    try:
+        try:
+            _lock_file(fd)
+        except (IOError, OSError):
+            locked = False
+        else:
+            locked = True
+        try:
+            yield locked
+        finally:
+            if locked:
+                _unlock_file(fd)
+    finally:
+        os.close(fd)
+
+
+def record_hook_latency(git_dir, outcome, seconds):
+    """Add one hook invocation to the histogram stored in git_dir.
+
+    Recording is best effort: a read-only or vanished git dir, or a lock
+    that cannot be taken, must never make the commit fail.
+    """
+    path = os.path.join(git_dir, HISTOGRAM_FILENAME)
+    with histogram_lock(git_dir) as locked:
+        if not locked:
+            return
+        histogram = read_histogram(path)
+        histogram[outcome][bucket_index(seconds)] += 1
+        try:
+            write_histogram(path, histogram)
+        except (IOError, OSError):
+            pass
+
+
+def percentile(buckets, fraction):
+    """Return the upper bound, in seconds, of the bucket holding the given
+    fraction of samples, or None for an empty histogram.
+    """
+    total = sum(buckets)
+    if not total:
+        return None
+    threshold = fraction * total
+    seen = 0
+    for index, count in enumerate(buckets):
+        seen += count
+        if seen >= threshold:
+            return bucket_upper_bound(index)
+    return bucket_upper_bound(BUCKET_COUNT - 1)
+
+
+def format_stats(histogram):
+    rows = [('outcome', 'count', 'p50', 'p95', 'p99')]
+    combined = [sum(counts) for counts in zip(*histogram.values())]
+    series = [(outcome, histogram[outcome]) for outcome in OUTCOMES]
+    for outcome, buckets in series + [('all', combined)]:
+        row = [outcome, str(sum(buckets))]
+        for fraction in (0.50, 0.95, 0.99):
+            value = percentile(buckets, fraction)
+            row.append('-' if value is None else '{0:.1f}ms'.format(value * 1e3))
+        rows.append(tuple(row))
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return '\n'.join(
+        '  '.join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip()
+        for row in rows
+    ) + '\n'
+
+
+def get_git_dir():
+    with open(os.devnull, 'w') as devnull:
+        return subprocess.check_output(
+            [
+                'git',
+                'rev-parse',
+                '--git-dir',
+            ],
+            stderr=devnull,
+        ).decode('UTF-8').strip()
+
+
+def main(argv=None):
+    """Print hook latency percentiles recorded in the current repository."""
+    parser = argparse.ArgumentParser(prog='giticket stats')
+    parser.add_argument('--reset', action='store_true',
+                        help='Clear the recorded latencies.')
+    args = parser.parse_args(argv)
+    try:
+        git_dir = get_git_dir()
+    except (subprocess.CalledProcessError, OSError):
+        sys.stderr.write('NOT A GIT REPOSITORY: run giticket stats inside a git repository\n')
+        return 1
+    path = os.path.join(git_dir, HISTOGRAM_FILENAME)
+    if args.reset:
+        with histogram_lock(git_dir):
+            write_histogram(path, empty_histogram())
+        return 0
+    sys.stdout.write(format_stats(read_histogram(path)))
+    return 0
@@ -0,0 +1,736 @@
+# -*- coding: utf-8 -*-
+"""Differential fuzzing of giticket's fast paths against reference behavior.
+
+Every optimized path must give byte-identical results to the behavior it
+replaces. Each target below generates random cases, runs them through the
+reference and the fast path, and reports any divergence, shrunk to a
+minimal reproducer::
+
+    python tests/differential.py --iterations 100000 --seed 7
+    python tests/differential.py --targets regex,scopes
+
+Divergences are printed as JSON lines; replay one with ``--seed`` and the
+reported ``iteration``. ``tests/test_differential.py`` runs a short pass of
+every target as part of the test suite.
+
+Known intentional differences are kept out of the generated inputs: empty
+messages (the reference crashes on them), patterns rejected as unsafe, and
+patterns that can match whitespace (git prints the branch name with a
+trailing newline, the fast paths don't keep it). Features the reference
+lacks are modelled on its input instead: a scope the staged paths imply is
+written into the header before the reference runs.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import argparse
+import atexit
+import collections
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import mock
+import six
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from giticket import batch  # noqa: E402
+from giticket import patterns  # noqa: E402
+from giticket import scopes  # noqa: E402
+from giticket.giticket import ALLOWED_SCOPES  # noqa: E402
+from giticket.giticket import ALLOWED_TYPES  # noqa: E402
+from giticket.giticket import BRANCH_ENV_VARS  # noqa: E402
+from giticket.giticket import TICKET_FILENAME  # noqa: E402
+from giticket.giticket import find_closest_match  # noqa: E402
+from giticket.giticket import read_head_branch  # noqa: E402
+from giticket.giticket import underscore_split_mode  # noqa: E402
+from giticket.giticket import update_commit_message  # noqa: E402
+
+TESTING_MODULE = 'giticket.giticket'
+
+MODES = ('underscore_split', 'regex_match')
+SCISSORS = '# ------------------------ >8 ------------------------'
+
+
+def reference_update_commit_message(filename, regex, mode, format_string, get_branch_name):
+    """The hook as it was before any fast path, with the branch lookup
+    passed in. Kept verbatim apart from that; do not optimize.
+    """
+    with io.open(filename, 'r+') as fd:
+        contents = fd.readlines()
+        commit_msg = contents[0].rstrip('\r\n')
+        # Check if we can grab ticket info from branch name.
+        branch = get_branch_name()
+
+        # Bail if commit message starts with "fixup!", "Merge branch", "Merge pull request"
+        # or commit message already contains tickets
+        if commit_msg.startswith('fixup!') or commit_msg.startswith('Merge branch') or commit_msg.startswith('Merge pull request'):
+            return
+
+        # Parse commit message for conventional commit structure regardless of ticket presence
+        # Expected format: "type(scope): message"
+        type_scope_pattern = r'^([a-zA-Z]+)\(([a-zA-Z0-9]+)\):\s*(.*)$'
+        match_res = re.match(type_scope_pattern, commit_msg)
+
+        if match_res:
+            # Extract parts from the regex match
+            commit_type = match_res.group(1).lower()  # Convert type to lowercase
+            commit_scope = match_res.group(2).upper()  # Convert scope to uppercase
+            commit_message = match_res.group(3)
+
+            # Collect validation errors
+            errors = []
+
+            # Validate commit type
+            if commit_type not in ALLOWED_TYPES:
+                # Try to find a similar type to suggest
+                suggested_type = find_closest_match(commit_type, ALLOWED_TYPES)
+                if suggested_type:
+                    errors.append(f"Do you mean `{suggested_type}` instead of `{commit_type}`?")
+                errors.append(f"WRONG TYPE DETECTED: Invalid commit type '{commit_type}'. Allowed types are: {', '.join(ALLOWED_TYPES)}")
+
+            # Validate commit scope
+            if commit_scope not in ALLOWED_SCOPES:
+                # Try to find a similar scope to suggest
+                suggested_scope = find_closest_match(commit_scope, ALLOWED_SCOPES)
+                if suggested_scope:
+                    errors.append(f"Do you mean `{suggested_scope}` instead of `{commit_scope}`?")
+                errors.append(f"WRONG SCOPE DETECTED: Invalid commit scope '{commit_scope}'. Allowed scopes are: {', '.join(ALLOWED_SCOPES)}")
+
+            # If there are any errors, display them and exit
+            if errors:
+                for error in errors:
+                    sys.stderr.write(error + "\n")
+                sys.exit(1)
+
+            # If commit message already contains tickets, don't modify it
+            if any(re.search(regex, content) for content in contents):
+                return
+
+        tickets = re.findall(regex, branch)
+        if tickets:
+            if mode == underscore_split_mode:
+                tickets = [branch.split(six.text_type('_'))[0]]
+            tickets = [t.strip() for t in tickets]
+
+            if match_res:
+                # Format as conventional commit: type(scope): ticket message
+                new_commit_msg = "{type}({scope}): {ticket} {message}".format(
+                    type=commit_type,
+                    scope=commit_scope,
+                    ticket=tickets[0],
+                    message=commit_message
+                )
+            else:
+                # If the format doesn't match, inform the user about the expected format
+                sys.stderr.write("WRONG FORMAT DETECTED: Commit message must follow the format 'type(scope): message'\n")
+                sys.stderr.write(f"Allowed types: {', '.join(ALLOWED_TYPES)}\n")
+                sys.stderr.write(f"Allowed scopes: {', '.join(ALLOWED_SCOPES)}\n")
+                sys.exit(1)
+
+            contents[0] = six.text_type(new_commit_msg + "\n")
+            fd.seek(0)
+            fd.writelines(contents)
+            fd.truncate()
+
+
+# Generators. Each takes a random.Random and returns a JSON-serializable case.
+
+_REGEX_ATOMS = [
+    'SP', 'JIRA', 'PROJ', '#', '-', '/', 'X',
+    '[A-Z]', '[a-z]', '\\d', '[0-9]', '\\w', '[A-Z0-9]', '[-_]', '(?:SP|JIRA)',
+]
+_REGEX_QUANTIFIERS = ['', '', '+', '+', '*', '?', '{2}', '{1,3}', '{2,}', '{4,}']
+_REGEX_COMMON = [r'[A-Z]+-\d+', r'\d{4,}', r'[A-Z]{2,5}-[0-9]+', r'(?:SP|JIRA)-\d+', r'#\d+', r'\w+-\d+']
+
+
+def random_regex(rng):
+    if rng.random() < 0.4:
+        return rng.choice(_REGEX_COMMON)
+    parts = []
+    for _ in range(rng.randint(1, 4)):
+        atom = rng.choice(_REGEX_ATOMS)
+        quantifier = rng.choice(_REGEX_QUANTIFIERS)
+        if quantifier and len(atom) > 1 and not atom.startswith(('[', '\\', '(')):
+            atom = '(?:{0})'.format(atom)
+        parts.append(atom + quantifier)
+    return ''.join(parts)
+
+
+def _random_ticket(rng):
+    return rng.choice(['SP', 'JIRA', 'AB', 'X', 'PROJ']) + '-' + str(rng.randint(0, 99999))
+
+
+def _random_words(rng, alphabet='abcxyzSPJIRA-_/# 0123456789٣'):
+    words = []
+    for _ in range(rng.randint(0, 6)):
+        if rng.random() < 0.2:
+            words.append(_random_ticket(rng))
+        else:
+            words.append(''.join(rng.choice(alphabet) for _ in range(rng.randint(1, 8))))
+    return ' '.join(words)
+
+
+def random_branch(rng):
+    shape = rng.randint(0, 5)
+    if shape == 0:
+        return _random_ticket(rng) + '_' + _random_words(rng, 'abc_-')
+    if shape == 1:
+        return 'feature/{0}/{1}'.format(_random_ticket(rng), _random_words(rng, 'abc-'))
+    if shape == 2:
+        return 'HEAD'
+    if shape == 3:
+        return '{0}-{1}'.format(_random_ticket(rng), _random_ticket(rng))
+    return _random_words(rng, 'abcSPJIRA-_/0123456789').replace(' ', '-')
+
+
+def random_header(rng):
+    commit_type = rng.choice(ALLOWED_TYPES + ['fet', 'bogus', 'FIX', 'Feat'])
+    scope = rng.choice(ALLOWED_SCOPES + ['cp', 'Ui', 'NOPE', 'CPPP', '12'])
+    text = _random_words(rng)
+    shape = rng.randint(0, 9)
+    if shape <= 4:
+        return '{0}({1}):{2}{3}'.format(commit_type, scope, rng.choice(['', ' ', '  ']), text)
+    if shape == 5:
+        return '{0}: {1}'.format(commit_type, text)
+    if shape == 6:
+        return 'fixup! {0}({1}): {2}'.format(commit_type, scope, text)
+    if shape == 7:
+        return rng.choice(['Merge branch ', 'Merge pull request ']) + text
+    return text or 'x'
+
+
+def random_message(rng):
+    lines = [random_header(rng)]
+    for _ in range(rng.randint(0, 6)):
+        shape = rng.randint(0, 6)
+        if shape == 0:
+            lines.append('')
+        elif shape == 1:
+            lines.append('# ' + _random_words(rng))
+        elif shape == 2:
+            lines.append(SCISSORS)
+        elif shape == 3:
+            lines.append('+' + _random_words(rng))
+        else:
+            lines.append(_random_words(rng))
+    newline = rng.choice(['\n', '\n', '\r\n', '\r'])
+    message = newline.join(lines)
+    if rng.random() < 0.5:
+        message += newline
+    if rng.random() < 0.1:
+        message = message.replace('\n', '\r\n', 1)
+    return message
+
+
+def random_hook_case(rng):
+    return {
+        'message': random_message(rng),
+        'branch': random_branch(rng),
+        'regex': random_regex(rng) if rng.random() < 0.3 else r'[A-Z]+-\d+',
+        'mode': rng.choice(MODES),
+    }
+
+
+def random_repo_hook_case(rng):
+    case = random_hook_case(rng)
+    # Where the hook finds the branch: HEAD, a CI variable or the ticket file.
+    case['source'] = rng.choice(['head', 'head', 'env', 'file'])
+    if rng.random() < 0.5:
+        case.update(random_scopes_case(rng))
+    else:
+        case.update(entries=None, paths=[])
+    return case
+
+
+_MALFORMED_VALUES = [0, 12, 1.5, True, False, [], ['fix(CP): x'], {}, {'branch': 'SP-1_x'}]
+
+
+def random_batch_case(rng):
+    case = random_hook_case(rng)
+    case['id'] = rng.choice([0, 7, 'abc', None, [1, 2], {'k': 'v'}])
+    if rng.random() < 0.2:
+        case[rng.choice(['message', 'branch'])] = rng.choice(_MALFORMED_VALUES)
+    return case
+
+
+def random_regex_case(rng):
+    return {
+        'regex': random_regex(rng),
+        'text': _random_words(rng, 'AZSPJIRaz-_/#09\n٣ ') + _random_words(rng),
+    }
+
+
+def random_scopes_case(rng):
+    directories = ['src', 'src/ui', 'src/ui/i18n', 'src/auth', 'docs', 'vendor/pkg', 'a/b/c', '.']
+    entries = []
+    for _ in range(rng.randint(0, 6)):
+        prefix = rng.choice(directories)
+        if rng.random() < 0.2:
+            prefix += '/file{0}.py'.format(rng.randint(0, 3))
+        if rng.random() < 0.3:
+            prefix += '/'
+        entries.append([prefix, rng.choice(ALLOWED_SCOPES)])
+    paths = sorted(
+        '{0}/file{1}.py'.format(rng.choice(directories), rng.randint(0, 3)).lstrip('./')
+        for _ in range(rng.randint(0, 20))
+    )
+    return {'entries': entries, 'paths': paths}
+
+
+def random_head_case(rng):
+    if rng.random() < 0.15:
+        return {'branch': None}
+    parts = []
+    for _ in range(rng.randint(1, 3)):
+        parts.append(''.join(rng.choice('abcSPJ-_0129.') for _ in range(rng.randint(1, 8))))
+    return {'branch': '/'.join(parts)}
+
+
+# Checks. Each runs a case through the reference and the fast path and
+# returns None if they agree, or a description of how they differ.
+
+def _unsafe(regex):
+    try:
+        patterns.compile_ticket_regex(regex)
+    except (patterns.UnsafeRegexError, re.error):
+        return True
+    return False
+
+
+@contextlib.contextmanager
+def _message_file(message):
+    directory = tempfile.mkdtemp(prefix='giticket-fuzz')
+    path = os.path.join(directory, 'message.txt')
+    with io.open(path, 'w', newline='') as fd:
+        fd.write(message)
+    try:
+        yield path
+    finally:
+        shutil.rmtree(directory)
+
+
+def _run_hook(run, message):
+    """Run a hook implementation on message; return (rejected, file, stderr)."""
+    stderr = io.StringIO()
+    with _message_file(message) as path:
+        rejected = False
+        with contextlib.redirect_stderr(stderr):
+            try:
+                run(path)
+            except SystemExit:
+                rejected = True
+        with io.open(path, newline='') as fd:
+            return rejected, fd.read(), stderr.getvalue()
+
+
+def _run_current_hook(case):
+    # git prints the branch name with a trailing newline.
+    with mock.patch(TESTING_MODULE + '.get_branch_name', return_value=case['branch'] + '\n'):
+        return _run_hook(
+            lambda path: update_commit_message(path, case['regex'], case['mode'],
+                                               '{ticket} {commit_msg}', ['head'], None),
+            case['message'])
+
+
+class _GitRepo(object):
+    """A scratch repository whose HEAD, index and git dir the repository
+    targets set up for each case.
+    """
+
+    def __init__(self):
+        self.path = tempfile.mkdtemp(prefix='giticket-fuzz-repo')
+        self.git('init', '-q')
+        self.git('-c', 'user.name=fuzz', '-c', 'user.email=fuzz@example.com',
+                 'commit', '-q', '--allow-empty', '-m', 'root')
+        self.commit = self.git('rev-parse', 'HEAD').strip()
+        self.git_dir = os.path.join(self.path, '.git')
+        self.staged = []
+
+    def git(self, *args):
+        return subprocess.check_output(('git',) + args, cwd=self.path,
+                                       stderr=subprocess.STDOUT).decode('UTF-8')
+
+    def checkout(self, branch):
+        """Point HEAD at branch, or detach it for None. Returns False if
+        git cannot have such a branch.
+        """
+        if branch is None:
+            self.git('update-ref', '--no-deref', 'HEAD', self.commit)
+            return True
+        try:
+            self.git('check-ref-format', '--branch', branch)
+        except subprocess.CalledProcessError:
+            return False
+        ref = 'refs/heads/' + branch
+        try:
+            self.git('update-ref', ref, self.commit)
+        except subprocess.CalledProcessError:
+            # Clashes with an existing ref, e.g. "a" and "a/b".
+            return False
+        self.git('symbolic-ref', 'HEAD', ref)
+        return True
+
+    def stage(self, paths):
+        """Make paths the only staged files."""
+        if paths == self.staged:
+            return
+        self.git('read-tree', '--empty')
+        for path in paths:
+            full_path = os.path.join(self.path, path)
+            if not os.path.isdir(os.path.dirname(full_path)):
+                os.makedirs(os.path.dirname(full_path))
+            with io.open(full_path, 'w') as fd:
+                fd.write(path)
+        if paths:
+            self.git('add', '-f', '--', *paths)
+        self.staged = list(paths)
+
+    @contextlib.contextmanager
+    def cwd(self):
+        previous = os.getcwd()
+        os.chdir(self.path)
+        try:
+            yield
+        finally:
+            os.chdir(previous)
+
+    def close(self):
+        shutil.rmtree(self.path)
+
+
+_repo = None
+
+
+def _scratch_repo():
+    global _repo
+    if _repo is None:
+        _repo = _GitRepo()
+        atexit.register(_repo.close)
+    return _repo
+
+
+def _reference_scope(entries, paths):
+    """The most common scope of paths under the longest matching prefix of
+    entries, later entries winning, ties broken alphabetically.
+    """
+    counts = collections.Counter()
+    for path in paths:
+        parts = [part for part in path.split('/') if part]
+        best = None
+        for index, (prefix, scope) in enumerate(entries):
+            prefix_parts = [part for part in prefix.split('/') if part and part != '.']
+            if parts[:len(prefix_parts)] == prefix_parts:
+                key = (len(prefix_parts), index)
+                if best is None or key > best[0]:
+                    best = (key, scope)
+        if best is not None:
+            counts[best[1]] += 1
+    if not counts:
+        return None
+    return min(counts, key=lambda scope: (-counts[scope], scope))
+
+
+def _with_scope(message, scope):
+    """Return message with scope written into a "type: text" header, as the
+    hook would fill it in, or None if the header does not take one.
+    """
+    lines = io.StringIO(message, newline=None).readlines()
+    header = lines[0].rstrip('\n')
+    match_res = re.match(r'^([a-zA-Z]+):\s*(.*)$', header)
+    if not match_res or match_res.group(1).lower() not in ALLOWED_TYPES:
+        return None
+    # A rewritten message is written back with "\n" line endings.
+    lines[0] = '{0}({1}): {2}\n'.format(match_res.group(1).lower(), scope, match_res.group(2))
+    return ''.join(lines)
+
+
+def _with_scope_hint(stderr, scope):
+    """Add the staged scope hint the hook prints for an invalid scope."""
+    lines = stderr.splitlines(True)
+    for index, line in enumerate(lines):
+        if line.startswith('WRONG SCOPE DETECTED'):
+            suggestion = re.match(r'^Do you mean `(.*)` instead of', lines[index - 1]) if index else None
+            if suggestion is None or suggestion.group(1) != scope:
+                lines.insert(index, 'The staged files suggest scope `{0}`.\n'.format(scope))
+            break
+    return ''.join(lines)
+
+
+@contextlib.contextmanager
+def _branch_env(name=None, value=None):
+    with mock.patch.dict(os.environ):
+        for variable in BRANCH_ENV_VARS:
+            os.environ.pop(variable, None)
+        if name is not None:
+            os.environ[name] = value
+        yield
+
+
+def _setup_repo_hook(repo, case):
+    """Set up the repository for a hook case; return the branch the
+    reference sees, or None if the case cannot be set up.
+    """
+    source = case['source']
+    value = case['branch']
+    ticket_file = os.path.join(repo.git_dir, TICKET_FILENAME)
+    if os.path.exists(ticket_file):
+        os.unlink(ticket_file)
+    if source == 'head':
+        if not repo.checkout(None if value == 'HEAD' else value):
+            return None
+    else:
+        # The branch comes from the env var or file alone; HEAD has no
+        # branch to fall back on.
+        value = value.strip()
+        if not value:
+            return None
+        repo.checkout(None)
+        if source == 'file':
+            with io.open(ticket_file, 'w') as fd:
+                fd.write(value + '\n')
+
+    scope_map = os.path.join(repo.path, scopes.SCOPE_MAP_FILENAME)
+    if case['entries'] is None:
+        if os.path.exists(scope_map):
+            os.unlink(scope_map)
+    else:
+        with io.open(scope_map, 'w') as fd:
+            fd.write(''.join('{0} {1}\n'.format(prefix, scope)
+                             for prefix, scope in case['entries']))
+    repo.stage(case['paths'])
+
+    head = repo.git('rev-parse', '--abbrev-ref', 'HEAD')
+    if source == 'head' or not re.findall(case['regex'], value):
+        return head
+    return value
+
+
+def check_hook(case):
+    """update_commit_message, run by git's rules in a scratch repository
+    (message in $GIT_DIR/COMMIT_EDITMSG, branch from HEAD, a CI variable or
+    the ticket file, scope from the staged paths) against the original eager
+    hook reading the branch from ``git rev-parse``.
+    """
+    if _unsafe(case['regex']):
+        return None
+    repo = _scratch_repo()
+    branch = _setup_repo_hook(repo, case)
+    if branch is None:
+        return None
+
+    message = case['message']
+    scope = None
+    if case['entries'] is not None:
+        # git lists each staged path once.
+        scope = _reference_scope(case['entries'], sorted(set(case['paths'])))
+    filled = _with_scope(message, scope) if scope is not None else None
+    expected = _run_hook(
+        lambda path: reference_update_commit_message(
+            path, case['regex'], case['mode'], '{ticket} {commit_msg}',
+            lambda: branch),
+        filled or message)
+    if scope is not None:
+        expected = expected[:2] + (_with_scope_hint(expected[2], scope),)
+    if filled is not None and expected[0]:
+        # Rejected before the hook would have written the scope in.
+        expected = (True, message, expected[2])
+
+    path = os.path.join(repo.git_dir, 'COMMIT_EDITMSG')
+    with io.open(path, 'w', newline='') as fd:
+        fd.write(message)
+    env = {'env': ('GITICKET_BRANCH', case['branch']), 'head': (), 'file': ()}[case['source']]
+    stderr = io.StringIO()
+    rejected = False
+    with repo.cwd(), _branch_env(*env), contextlib.redirect_stderr(stderr):
+        try:
+            update_commit_message(path, case['regex'], case['mode'], '{ticket} {commit_msg}')
+        except SystemExit:
+            rejected = True
+    with io.open(path, newline='') as fd:
+        actual = (rejected, fd.read(), stderr.getvalue())
+    if actual != expected:
+        return {'reference': expected, 'fast_path': actual, 'reference_branch': branch}
+    return None
+
+
+def check_batch(case):
+    """batch.process_line against update_commit_message on a file, and
+    malformed records against a per-record rejection.
+    """
+    if _unsafe(case['regex']):
+        return None
+    record = {'id': case['id'], 'message': case['message'], 'branch': case['branch']}
+    result = json.loads(batch.process_line(json.dumps(record), case['regex'], case['mode']))
+    if not (isinstance(case['message'], six.text_type) and
+            isinstance(case['branch'], six.text_type)):
+        if (result['id'] != case['id'] or result['status'] != 'rejected' or
+                not result['errors'][0].startswith('INVALID RECORD:')):
+            return {'reference': 'INVALID RECORD', 'fast_path': result}
+        return None
+    rejected, message, stderr = _run_current_hook(case)
+    actual = (
+        result['id'] == case['id'],
+        result['status'] == 'rejected',
+        result['message'],
+        ''.join(error + '\n' for error in result['errors']),
+    )
+    if actual != (True, rejected, message, stderr):
+        return {'reference': (True, rejected, message, stderr), 'fast_path': actual}
+    return None
+
+
+def check_regex(case):
+    """TicketPattern (linear rewrite) against plain re."""
+    if _unsafe(case['regex']):
+        return None
+    ticket_pattern = patterns.TicketPattern(case['regex'], budget=None)
+    expected_search = re.search(case['regex'], case['text'])
+    actual_search = ticket_pattern.search(case['text'])
+    expected = (re.findall(case['regex'], case['text']),
+                expected_search.span() if expected_search else None)
+    actual = (ticket_pattern.findall(case['text']),
+              actual_search.span() if actual_search else None)
+    if actual != expected:
+        return {'reference': expected, 'fast_path': actual,
+                'linear': ticket_pattern.linear and ticket_pattern.linear.pattern}
+    return None
+
+
+def check_scopes(case):
+    """scopes.count_scopes (cached directory walk) against matching each
+    path on its own.
+    """
+    trie = scopes.build_trie([tuple(entry) for entry in case['entries']])
+    expected = collections.Counter(
+        scope for scope in (scopes.match_path(trie, path) for path in case['paths'])
+        if scope is not None
+    )
+    actual = scopes.count_scopes(trie, case['paths'])
+    if actual != expected:
+        return {'reference': dict(expected), 'fast_path': dict(actual)}
+    return None
+
+
+def check_head(case):
+    """read_head_branch against ``git rev-parse --abbrev-ref HEAD``."""
+    repo = _scratch_repo()
+    if not repo.checkout(case['branch']):
+        return None
+    expected = repo.git('rev-parse', '--abbrev-ref', 'HEAD').rstrip('\n')
+    actual = read_head_branch(repo.git_dir)
+    if actual is not None and actual != expected:
+        return {'reference': expected, 'fast_path': actual}
+    return None
+
+
+TARGETS = collections.OrderedDict([
+    ('hook', (random_repo_hook_case, check_hook)),
+    ('batch', (random_batch_case, check_batch)),
+    ('regex', (random_regex_case, check_regex)),
+    ('scopes', (random_scopes_case, check_scopes)),
+    ('head', (random_head_case, check_head)),
+])
+
+# Fields minimize() may shrink; the rest define the behavior under test.
+_SHRINKABLE = ('message', 'branch', 'text', 'paths', 'entries')
+
+
+def _shrink_candidates(value):
+    """Yield smaller versions of a string or list, largest cuts first."""
+    size = len(value)
+    chunk = size // 2
+    while chunk >= 1:
+        for start in range(0, size - chunk + 1, chunk):
+            yield value[:start] + value[start + chunk:]
+        chunk //= 2
+
+
+def _check(check, case):
+    """Run check on case, reporting an exception as a divergence."""
+    try:
+        return check(case)
+    except Exception as e:
+        return {'error': repr(e)}
+
+
+def minimize(case, check):
+    """Greedily remove chunks of the shrinkable fields while check still
+    reports a divergence.
+    """
+    case = dict(case)
+    progress = True
+    while progress:
+        progress = False
+        for field in _SHRINKABLE:
+            value = case.get(field)
+            if not value or not isinstance(value, (six.text_type, list)):
+                continue
+            for candidate in _shrink_candidates(value):
+                if field == 'message' and not candidate:
+                    continue
+                trial = dict(case, **{field: candidate})
+                if _check(check, trial) is not None:
+                    case = trial
+                    progress = True
+                    break
+    return case
+
+
+def run(targets, iterations, seed, max_failures=5):
+    """Yield a report for every divergence found, minimized."""
+    for name in targets:
+        generate, check = TARGETS[name]
+        failures = 0
+        for iteration in range(iterations):
+            rng = random.Random('{0}:{1}:{2}'.format(seed, name, iteration))
+            case = generate(rng)
+            divergence = _check(check, case)
+            if divergence is None:
+                continue
+            minimized = minimize(case, check)
+            yield {
+                'target': name,
+                'seed': seed,
+                'iteration': iteration,
+                'case': minimized,
+                'divergence': _check(check, minimized) or divergence,
+            }
+            failures += 1
+            if failures >= max_failures:
+                break
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--iterations', type=int, default=10000,
+                        help='Cases to generate per target.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--targets', default=','.join(TARGETS),
+                        help='Comma-separated targets, from: {0}.'.format(', '.join(TARGETS)))
+    parser.add_argument('--max-failures', type=int, default=5,
+                        help='Stop a target after this many divergences.')
+    args = parser.parse_args(argv)
+    targets = [name.strip() for name in args.targets.split(',') if name.strip()]
+    unknown = [name for name in targets if name not in TARGETS]
+    if unknown:
+        parser.error('unknown targets: {0}'.format(', '.join(unknown)))
+
+    found = 0
+    for report in run(targets, args.iterations, args.seed, args.max_failures):
+        sys.stdout.write(json.dumps(report, ensure_ascii=False) + '\n')
+        sys.stdout.flush()
+        found += 1
+    return 1 if found else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
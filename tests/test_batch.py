@@ -0,0 +1,118 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import io
+import json
+
+import mock
+import pytest
+import six
+
+from giticket import batch
+from giticket.giticket import main
+from giticket.giticket import update_commit_message
+
+TESTING_MODULE = 'giticket.giticket'
+
+RECORDS = [
+    {'id': 1, 'message': 'fix(cp): some message\n\nbody', 'branch': 'SP-12_feature'},
+    {'id': 'b', 'message': 'FEAT(ui): crlf\r\n\r\nbody\r\n', 'branch': 'SP-3_x'},
+    {'id': 3, 'message': 'fixup! fix(CP): something', 'branch': 'SP-1_x'},
+    {'id': 4, 'message': 'fix(CP): SP-9 has a ticket', 'branch': 'SP-1_x'},
+    {'id': 5, 'message': 'fix(CP): no branch'},
+    {'id': 6, 'message': 'bad(CP): some message', 'branch': 'SP-1_x'},
+    {'id': 7, 'message': 'no format', 'branch': 'SP-1_x'},
+]
+
+
+@pytest.mark.parametrize('record', RECORDS)
+@mock.patch(TESTING_MODULE + '.sys.stderr.write')
+@mock.patch(TESTING_MODULE + '.get_branch_name')
+def test_process_record_matches_hook(mock_branch_name, mock_stderr_write, record, tmpdir):
+    mock_branch_name.return_value = record.get('branch') or 'no-ticket'
+    path = tmpdir.join('file.txt')
+    path.write_binary(record['message'].encode('UTF-8'))
+    try:
+        update_commit_message(six.text_type(path), r'[A-Z]+-\d+',
+                              'underscore_split', '{ticket} {commit_msg}', ['head'])
+        rejected = False
+    except SystemExit:
+        rejected = True
+
+    result = batch.process_record(record, r'[A-Z]+-\d+', 'underscore_split')
+    assert result['id'] == record['id']
+    assert (result['status'] == 'rejected') is rejected
+    if rejected:
+        assert result['message'] == record['message']
+        assert [mock.call(error + '\n') for error in result['errors']] == \
+            mock_stderr_write.call_args_list
+    elif result['status'] == 'rewrote':
+        assert result['message'] == path.read_binary().decode('UTF-8')
+    else:
+        assert result['status'] == 'bailed'
+        assert result['message'] == record['message']
+
+
+def test_process_record_empty_branch():
+    # An empty branch name is still a branch, as in the hook.
+    record = {'id': 1, 'message': 'no format', 'branch': ''}
+    result = batch.process_record(record, r'(?:SP-\d+)?', 'regex_match')
+    assert result['status'] == 'rejected'
+    assert batch.process_record(dict(record, branch=None), r'(?:SP-\d+)?',
+                                'regex_match')['status'] == 'bailed'
+
+
+def test_process_line_invalid_record():
+    for line in ('not json', '[1, 2]'):
+        result = json.loads(batch.process_line(line, r'[A-Z]+-\d+', 'regex_match'))
+        assert result['status'] == 'rejected'
+        assert result['errors'][0].startswith('INVALID RECORD:')
+
+
+@pytest.mark.parametrize('record', (
+    {'id': 1, 'branch': 'SP-1_x'},
+    {'id': 1, 'message': None, 'branch': 'SP-1_x'},
+    {'id': 1, 'message': 123, 'branch': 'SP-1_x'},
+    {'id': 1, 'message': 0, 'branch': 'SP-1_x'},
+    {'id': 1, 'message': ['fix(CP): x'], 'branch': 'SP-1_x'},
+    {'id': 1, 'message': 'fix(CP): x', 'branch': 12},
+    {'id': 1, 'message': 'fix(CP): x', 'branch': {'name': 'SP-1_x'}},
+))
+def test_process_line_invalid_fields(record):
+    result = json.loads(batch.process_line(json.dumps(record), r'[A-Z]+-\d+', 'regex_match'))
+    assert result['id'] == 1
+    assert result['status'] == 'rejected'
+    assert result['errors'][0].startswith('INVALID RECORD:')
+
+
+def test_iter_results_continues_after_invalid_record():
+    lines = ['{"id": 1, "message": 123}\n'] + [json.dumps(record) + '\n' for record in RECORDS]
+    results = [json.loads(line) for line in
+               batch.iter_results(lines * 2, r'[A-Z]+-\d+', 'regex_match', jobs=2)]
+    assert len(results) == (len(RECORDS) + 1) * 2
+    assert results[len(RECORDS) + 1]['status'] == 'rejected'
+
+
+def test_iter_results_worker_pool():
+    lines = [json.dumps(record) + '\n' for record in RECORDS] * 50 + ['\n']
+    serial = list(batch.iter_results(lines, r'[A-Z]+-\d+', 'regex_match'))
+    pooled = list(batch.iter_results(lines, r'[A-Z]+-\d+', 'regex_match', jobs=2))
+    assert len(serial) == len(RECORDS) * 50
+    assert pooled == serial
+
+
+def test_batch_command(monkeypatch, capsys):
+    stdin = ''.join(json.dumps(record) + '\n' for record in RECORDS[:3])
+    monkeypatch.setattr('sys.stdin', io.StringIO(stdin))
+    assert main(['batch', '--mode=regex_match']) == 0
+    results = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [(r['id'], r['status']) for r in results] == [
+        (1, 'rewrote'), ('b', 'rewrote'), (3, 'bailed'),
+    ]
+    assert results[1]['message'] == 'feat(UI): SP-3 crlf\n\nbody\n'
+
+
+def test_batch_command_unsafe_regex(monkeypatch, capsys):
+    monkeypatch.setattr('sys.stdin', io.StringIO(''))
+    assert main(['batch', '--regex', '(\\w+)+']) == 1
+    assert capsys.readouterr().err.startswith('UNSAFE REGEX DETECTED:')
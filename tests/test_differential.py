@@ -0,0 +1,33 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import shutil
+
+import pytest
+
+import differential
+
+
+@pytest.mark.parametrize('target', ('batch', 'regex', 'scopes'))
+def test_fast_paths_match_reference(target):
+    assert list(differential.run([target], iterations=300, seed=0)) == []
+
+
+@pytest.mark.skipif(not shutil.which('git'), reason='needs git')
+@pytest.mark.parametrize('test_data', (('hook', 100), ('head', 30)))
+def test_repository_paths_match_git(test_data):
+    target, iterations = test_data
+    assert list(differential.run([target], iterations=iterations, seed=0)) == []
+
+
+def test_check_batch_rejects_malformed_records():
+    case = {'id': 1, 'message': 123, 'branch': 'SP-1_x',
+            'regex': r'[A-Z]+-\d+', 'mode': 'regex_match'}
+    assert differential.check_batch(case) is None
+
+
+def test_minimize():
+    case = {'regex': 'x', 'text': 'aaaXbbbXccc'}
+    assert differential.minimize(case, lambda c: 'X' in c['text'] or None) == {
+        'regex': 'x', 'text': 'X',
+    }
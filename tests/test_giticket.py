@@ -1,6 +1,9 @@
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+import argparse
+import subprocess
+
 import mock
 import pytest
 import six
@@ -11,6 +14,14 @@ from giticket.giticket import update_commit_message
 from giticket.giticket import find_closest_match
 from giticket.giticket import ALLOWED_TYPES
 from giticket.giticket import ALLOWED_SCOPES
+from giticket.giticket import BRANCH_ENV_VARS
+from giticket.giticket import DEFAULT_RESOLVERS
+from giticket.giticket import TICKET_FILENAME
+from giticket.giticket import find_tickets
+from giticket.giticket import get_upstream_branch_name
+from giticket.giticket import iter_branch_names
+from giticket.giticket import read_head_branch
+from giticket.giticket import resolver_list
 
 TESTING_MODULE = 'giticket.giticket'
 
@@ -385,6 +396,152 @@ def test_get_branch_name(mock_subprocess):
     )
 
 
+@pytest.fixture
+def clean_env(monkeypatch):
+    for name in BRANCH_ENV_VARS:
+        monkeypatch.delenv(name, raising=False)
+    return monkeypatch
+
+
+@pytest.mark.parametrize('msg', (
+    'fixup! fix(CP): something',
+    'Merge branch \'foo\' into bar',
+    'fix(CP): SP-1234 already has a ticket',
+))
+@mock.patch(TESTING_MODULE + '.subprocess')
+@mock.patch(TESTING_MODULE + '.get_branch_name')
+def test_update_commit_message_does_not_resolve_branch(mock_branch_name, mock_subprocess,
+                                                       msg, tmpdir, clean_env):
+    tmpdir.join('HEAD').write('ref: refs/heads/SP-1234_feature\n')
+    path = tmpdir.join('COMMIT_EDITMSG')
+    path.write(msg)
+    update_commit_message(six.text_type(path), r'[A-Z]+-\d+',
+                          'regex_match', '{ticket} {commit_msg}')
+    assert path.read() == msg
+    assert not mock_branch_name.called
+    assert not mock_subprocess.check_output.called
+
+
+@mock.patch(TESTING_MODULE + '.get_branch_name')
+def test_update_commit_message_env_resolver(mock_branch_name, tmpdir, clean_env):
+    clean_env.setenv('GITHUB_HEAD_REF', 'feature/SP-4321-from-ci')
+    path = tmpdir.join('file.txt')
+    path.write('fix(CP): some message')
+    update_commit_message(six.text_type(path), r'[A-Z]+-\d+',
+                          'regex_match', '{ticket} {commit_msg}')
+    assert path.read() == 'fix(CP): SP-4321 some message\n'
+    assert not mock_branch_name.called
+
+
+@mock.patch(TESTING_MODULE + '.get_branch_name')
+def test_update_commit_message_ticket_file_resolver(mock_branch_name, tmpdir, clean_env):
+    tmpdir.join('HEAD').write('0123456789abcdef0123456789abcdef01234567\n')
+    tmpdir.join(TICKET_FILENAME).write('SP-777\n')
+    path = tmpdir.join('COMMIT_EDITMSG')
+    path.write('fix(CP): some message')
+    update_commit_message(six.text_type(path), r'[A-Z]+-\d+',
+                          'regex_match', '{ticket} {commit_msg}')
+    assert path.read() == 'fix(CP): SP-777 some message\n'
+    assert not mock_branch_name.called
+
+
+@pytest.mark.parametrize('mode', ('regex_match', 'underscore_split'))
+@mock.patch(TESTING_MODULE + '.subprocess.check_output')
+def test_update_commit_message_upstream_resolver(mock_check_output, mode, tmpdir, clean_env):
+    mock_check_output.return_value = b'refs/remotes/origin/SP-55_upstream\n'
+    tmpdir.join('HEAD').write('ref: refs/heads/local-work\n')
+    path = tmpdir.join('COMMIT_EDITMSG')
+    path.write('fix(CP): some message')
+    update_commit_message(six.text_type(path), r'[A-Z]+-\d+',
+                          mode, '{ticket} {commit_msg}',
+                          ['head', 'upstream'])
+    assert path.read() == 'fix(CP): SP-55 some message\n'
+    assert mock_check_output.call_count == 1
+
+
+@pytest.mark.parametrize('test_data', (
+    (b'refs/remotes/origin/SP-55_x\n', 'SP-55_x'),
+    (b'refs/remotes/fork/feature/SP-1\n', 'feature/SP-1'),
+    (b'refs/heads/main\n', 'main'),
+))
+@mock.patch(TESTING_MODULE + '.subprocess.check_output')
+def test_get_upstream_branch_name(mock_check_output, test_data):
+    output, expected = test_data
+    mock_check_output.return_value = output
+    assert get_upstream_branch_name() == expected
+
+
+@mock.patch(TESTING_MODULE + '.subprocess.check_output')
+def test_get_upstream_branch_name_no_upstream(mock_check_output):
+    mock_check_output.side_effect = subprocess.CalledProcessError(128, 'git')
+    assert get_upstream_branch_name() is None
+
+
+@mock.patch(TESTING_MODULE + '.get_branch_name')
+def test_update_commit_message_worktree_ticket_file(mock_branch_name, tmpdir, clean_env):
+    git_dir = tmpdir.mkdir('.git')
+    git_dir.join(TICKET_FILENAME).write('SP-1\n')
+    worktree_dir = git_dir.mkdir('worktrees').mkdir('other')
+    worktree_dir.join('commondir').write('../..\n')
+    worktree_dir.join('HEAD').write('ref: refs/heads/no-ticket\n')
+    path = worktree_dir.join('COMMIT_EDITMSG')
+    path.write('fix(CP): some message')
+    update_commit_message(six.text_type(path), r'[A-Z]+-\d+',
+                          'regex_match', '{ticket} {commit_msg}')
+    assert path.read() == 'fix(CP): SP-1 some message\n'
+    worktree_dir.join(TICKET_FILENAME).write('SP-2\n')
+    path.write('fix(CP): other message')
+    update_commit_message(six.text_type(path), r'[A-Z]+-\d+',
+                          'regex_match', '{ticket} {commit_msg}')
+    assert path.read() == 'fix(CP): SP-2 other message\n'
+    assert not mock_branch_name.called
+
+
+@pytest.mark.parametrize('test_data', (
+    ('ref: refs/heads/feature/SP-1\n', 'feature/SP-1'),
+    ('0123456789abcdef0123456789abcdef01234567\n', 'HEAD'),
+    ('ref: refs/remotes/origin/main\n', None),
+    ('ref: refs/heads/.invalid\n', None),
+))
+def test_read_head_branch(test_data, tmpdir):
+    head, expected = test_data
+    tmpdir.join('HEAD').write(head)
+    assert read_head_branch(six.text_type(tmpdir)) == expected
+
+
+@mock.patch(TESTING_MODULE + '.get_branch_name')
+def test_update_commit_message_reftable_head(mock_branch_name, tmpdir, clean_env):
+    mock_branch_name.return_value = 'SP-42_feature\n'
+    tmpdir.join('HEAD').write('ref: refs/heads/.invalid\n')
+    tmpdir.mkdir('reftable')
+    path = tmpdir.join('COMMIT_EDITMSG')
+    path.write('fix(CP): some message')
+    update_commit_message(six.text_type(path), r'[A-Z]+-\d+',
+                          'underscore_split', '{ticket} {commit_msg}', ['head'])
+    assert path.read() == 'fix(CP): SP-42 some message\n'
+    mock_branch_name.assert_called_once_with()
+
+
+def test_read_head_branch_missing(tmpdir):
+    assert read_head_branch(six.text_type(tmpdir)) is None
+
+
+@mock.patch(TESTING_MODULE + '.get_branch_name')
+def test_iter_branch_names_is_lazy(mock_branch_name, clean_env):
+    clean_env.setenv('GITICKET_BRANCH', 'SP-1_from_env')
+    branches = iter_branch_names(DEFAULT_RESOLVERS, None)
+    assert find_tickets(r'[A-Z]+-\d+', 'underscore_split', branches) == ['SP-1']
+    assert not mock_branch_name.called
+
+
+def test_resolver_list():
+    assert resolver_list('head, upstream') == ['head', 'upstream']
+    with pytest.raises(argparse.ArgumentTypeError):
+        resolver_list('head,bogus')
+    with pytest.raises(argparse.ArgumentTypeError):
+        resolver_list(',')
+
+
 @mock.patch(TESTING_MODULE + '.argparse')
 @mock.patch(TESTING_MODULE + '.update_commit_message')
 def test_main(mock_update_commit_message, mock_argparse):
@@ -393,8 +550,12 @@ def test_main(mock_update_commit_message, mock_argparse):
     mock_args.regex = None
     mock_args.format = None
     mock_args.mode = 'underscore_split'
+    mock_args.resolvers = None
+    mock_args.scope_map = None
     mock_argparse.ArgumentParser.return_value.parse_args.return_value = mock_args
     main()
     mock_update_commit_message.assert_called_once_with('foo.txt', r'[A-Z]+-\d+',
                                                        'underscore_split',
-                                                       '{ticket} {commit_msg}')
+                                                       '{ticket} {commit_msg}',
+                                                       DEFAULT_RESOLVERS,
+                                                       '.giticket-scopes')
@@ -0,0 +1,170 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import random
+import re
+
+import mock
+import pytest
+import six
+
+from giticket.giticket import update_commit_message
+from giticket.patterns import RegexTimeoutError
+from giticket.patterns import TicketPattern
+from giticket.patterns import UnsafeRegexError
+from giticket.patterns import compile_ticket_regex
+from giticket.patterns import find_nested_quantifier
+from giticket.patterns import linear_pattern
+from giticket.patterns import sre_parse
+
+TESTING_MODULE = 'giticket.giticket'
+
+
+@pytest.mark.parametrize('test_data', (
+    (r'[A-Z]+-\d+', False),
+    (r'\d{4,}', False),
+    (r'(?:[A-Z]{2,5}-)?\d+', False),
+    (r'[A-Z]+-\d+(?:,[A-Z]+-\d+)*', False),
+    (r'(?:\d{3}-)+', False),
+    (r'(?:, ?[A-Z]+-\d+)+', False),
+    (r'(?:,[A-Z,]+)*', True),
+    (r'(?:,(?:ab)+)*', True),
+    (r'(a+)+', True),
+    (r'(?:[A-Z]+-?)*\d', True),
+    (r'x(?:a|b\d*){2,}', True),
+    (r'(?=(\w+)+$)', True),
+))
+def test_find_nested_quantifier(test_data):
+    pattern, expected = test_data
+    assert find_nested_quantifier(sre_parse.parse(pattern)) is expected
+
+
+@pytest.mark.parametrize('test_data', (
+    (r'[A-Z]+-\d+', r'(?<![ABCDEFGHIJKLMNOPQRSTUVWXYZ])(?:[A-Z]+-\d+)'),
+    (r'\d{4,}', r'(?<![\d])(?:\d{4,})'),
+    (r'PROJ-[0-9]', r'PROJ-[0-9]'),
+    (r'[A-Z]{2,5}-\d+', r'[A-Z]{2,5}-\d+'),
+    (r'\d+-[A-Z]+', r'(?<![\d])(?:\d+-[A-Z]+)'),
+    # The variable length class overlaps with the next one.
+    (r'\w+\d', None),
+    # The last class may end inside a run of the first one.
+    (r'[A-Z]+-[A-Z]{2}', None),
+    (r'\w+-\d+', None),
+    # Not a plain sequence of character classes.
+    (r'(\d+)', None),
+    (r'[^_]+', None),
+    (r'(?i)[a-z]+-\d+', None),
+))
+def test_linear_pattern(test_data):
+    pattern, expected = test_data
+    assert linear_pattern(pattern) == expected
+
+
+@pytest.mark.parametrize('pattern', (
+    r'[A-Z]+-\d+',
+    r'\d{4,}',
+    r'[A-Z]{2,3}-\d{1,3}',
+    r'\d+-[A-Z]+',
+    r'X\d+',
+))
+def test_ticket_pattern_matches_re(pattern):
+    rng = random.Random(pattern)
+    ticket_pattern = TicketPattern(pattern)
+    assert ticket_pattern.linear is not None
+    for _ in range(500):
+        text = ''.join(rng.choice('AXZab_-0123 /٣') for _ in range(rng.randint(0, 30)))
+        assert ticket_pattern.findall(text) == re.findall(pattern, text)
+        assert bool(ticket_pattern.search(text)) == bool(re.search(pattern, text))
+
+
+def test_ticket_pattern_linear_on_long_runs():
+    ticket_pattern = TicketPattern(r'[A-Z]+-\d+')
+    # The rewrite cannot backtrack, so it runs without a watchdog.
+    assert ticket_pattern.linear is not None
+    assert ticket_pattern.findall('A' * 200000 + '-') == []
+    assert ticket_pattern.findall('A' * 200000 + '-1') == ['A' * 200000 + '-1']
+
+
+@pytest.mark.parametrize('pattern', (
+    r'(\w+\s?)+-\d+',
+    r'(?:a?a?)+b',
+    r'(?:-?-?)+x',
+    r'(?:-\d*-?)+x',
+    r'(?:-\d*-?)*\d',
+    r'(?:[A-Z]-?)+',
+    r'(?:a{0,1}b?)+',
+))
+def test_ticket_pattern_rejects_nested_quantifiers(pattern):
+    with pytest.raises(UnsafeRegexError):
+        TicketPattern(pattern)
+
+
+def test_ticket_pattern_time_budget():
+    ticket_pattern = TicketPattern(r'(?:a|aa)*c', budget=0.05)
+    with pytest.raises(RegexTimeoutError):
+        ticket_pattern.findall('a' * 60)
+
+
+def test_ticket_pattern_search_lines():
+    lines = ['fix(CP): message\n', '\n', 'refs SP-12\n', 'and SP-13\n']
+    for pattern in (r'[A-Z]+-\d+', r'(?:SP|AB)-\d+'):
+        match = TicketPattern(pattern).search_lines(lines)
+        assert match.group() == 'SP-12'
+        assert TicketPattern(pattern).search_lines(lines[:2]) is None
+
+
+@mock.patch('giticket.patterns.signal.setitimer')
+def test_ticket_pattern_watchdog_once_per_scan(mock_setitimer):
+    lines = ['line {0}\n'.format(i) for i in range(100)]
+    TicketPattern(r'[A-Z]+-\d+').search_lines(lines)
+    TicketPattern(r'[A-Z]+-\d+').findall(lines[0])
+    # The linear rewrite runs without a watchdog.
+    assert not mock_setitimer.called
+    TicketPattern(r'(?:SP|AB)-\d+').search_lines(lines)
+    # Armed and disarmed once for the whole scan.
+    assert mock_setitimer.call_count == 2
+
+
+def test_ticket_pattern_search_lines_time_budget():
+    ticket_pattern = TicketPattern(r'(?:a|aa)*c', budget=0.05)
+    with pytest.raises(RegexTimeoutError):
+        ticket_pattern.search_lines(['b\n'] * 10 + ['a' * 60 + '\n'])
+
+
+def test_ticket_pattern_search_lines_budget_is_per_line():
+    ticket_pattern = TicketPattern(r'\b[A-Z][A-Z0-9]+-\d+\b', budget=0.01)
+    assert ticket_pattern.linear is None
+    lines = ['+ some diff line {0} here\n'.format(i) for i in range(200000)]
+    # The scan takes far longer than the budget, but no single line does.
+    assert ticket_pattern.search_lines(lines + ['SP-1\n']).group() == 'SP-1'
+
+
+def test_compile_ticket_regex_reuses_compiled():
+    ticket_pattern = compile_ticket_regex(r'[A-Z]+-\d+')
+    assert compile_ticket_regex(ticket_pattern) is ticket_pattern
+
+
+@mock.patch(TESTING_MODULE + '.sys.stderr.write')
+@mock.patch(TESTING_MODULE + '.get_branch_name')
+def test_update_commit_message_unsafe_regex(mock_branch_name, mock_stderr_write, tmpdir):
+    mock_branch_name.return_value = 'feature/SP-1234/some-branch-name'
+    path = tmpdir.join('file.txt')
+    path.write('fix(CP): some message')
+    with pytest.raises(SystemExit):
+        update_commit_message(six.text_type(path), r'([A-Z]+)+-\d+',
+                              'regex_match', '{ticket} {commit_msg}')
+    assert mock_stderr_write.call_args[0][0].startswith('UNSAFE REGEX DETECTED:')
+    assert path.read() == 'fix(CP): some message'
+
+
+@mock.patch(TESTING_MODULE + '.sys.stderr.write')
+@mock.patch(TESTING_MODULE + '.get_branch_name')
+def test_update_commit_message_regex_timeout(mock_branch_name, mock_stderr_write, tmpdir):
+    mock_branch_name.return_value = 'a' * 60
+    path = tmpdir.join('file.txt')
+    path.write('fix(CP): some message')
+    slow_pattern = TicketPattern(r'(?:a|aa)*c', budget=0.05)
+    with pytest.raises(SystemExit):
+        update_commit_message(six.text_type(path), slow_pattern,
+                              'regex_match', '{ticket} {commit_msg}')
+    assert mock_stderr_write.call_args[0][0].startswith('REGEX TIMEOUT:')
@@ -0,0 +1,147 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import argparse
+import subprocess
+
+import mock
+import pytest
+
+from giticket import report
+from giticket.giticket import ALLOWED_SCOPES
+from giticket.giticket import main
+
+RECORDS = [
+    'Ann\x1f2024-01\x1ffix(cp): SP-1 one',
+    'Ann\x1f2024-01\x1ffix(CP): SP-2 two',
+    'Bob\x1f2024-02\x1ffeat(UI): SP-3 three',
+    'Bob\x1f2024-02\x1ffixup! feat(LOR): SP-3 four',
+    'Ann\x1f2024-02\x1fMerge branch \'x\' into y',
+    'Bob\x1f2024-03\x1fchore: bump\x1fwith separator',
+]
+
+
+@pytest.mark.parametrize('test_data', (
+    ('fix(cp): message', ('fix', 'CP', 'conventional')),
+    ('FEAT(Ui)!: breaking', ('feat', 'UI', 'conventional')),
+    ('chore: no scope', ('chore', '-', 'conventional')),
+    ('fixup! fix(AL): message', ('fix', 'AL', 'fixup')),
+    ('squash! some message', ('-', '-', 'fixup')),
+    ('Merge pull request #1 from org/branch', ('-', '-', 'merge')),
+    ('Some message: with a colon', ('-', '-', 'other')),
+    ('no colon at all', ('-', '-', 'other')),
+))
+def test_classify_header(test_data):
+    header, expected = test_data
+    assert report.classify_header(header) == expected
+
+
+def test_parse_log_counts():
+    columns = report.parse_log(RECORDS)
+    assert len(columns) == len(RECORDS)
+    assert columns.count(['type', 'scope']) == [
+        (('fix', 'CP'), 2),
+        (('-', '-'), 1),
+        (('chore', '-'), 1),
+        (('feat', 'LOR'), 1),
+        (('feat', 'UI'), 1),
+    ]
+    assert columns.count(['author']) == [(('Ann',), 3), (('Bob',), 3)]
+    assert columns.count(['scope', 'kind'])[-1] == (('UI', 'conventional'), 1)
+    assert columns.distinct('month') == set(['2024-01', '2024-02', '2024-03'])
+
+
+def test_parse_log_batches():
+    with mock.patch('giticket.report._BATCH_SIZE', 4):
+        columns = report.parse_log(RECORDS * 3)
+    assert columns.count(['month']) == [
+        (('2024-02',), 9), (('2024-01',), 6), (('2024-03',), 3),
+    ]
+
+
+@mock.patch('giticket.report.subprocess.Popen')
+def test_iter_log_records(mock_popen):
+    process = mock_popen.return_value
+    process.stdout.read.side_effect = [b'Ann\x1f2024-01\x1ffix(CP): a\0Bob\x1f2024', b'-02\x1fb', b'']
+    process.stderr.read.return_value = b''
+    process.returncode = 0
+    with mock.patch('giticket.report._READ_SIZE', 16):
+        assert list(report.iter_log_records('HEAD~2..HEAD')) == [
+            'Ann\x1f2024-01\x1ffix(CP): a',
+            'Bob\x1f2024-02\x1fb',
+        ]
+    assert mock_popen.call_args[0][0][-1] == 'HEAD~2..HEAD'
+
+
+@mock.patch('giticket.report.subprocess.Popen')
+def test_iter_log_records_git_error(mock_popen):
+    process = mock_popen.return_value
+    process.stdout.read.return_value = b''
+    process.stderr.read.return_value = b"fatal: bad revision 'nope'\n"
+    process.returncode = 128
+    with pytest.raises(subprocess.CalledProcessError) as excinfo:
+        list(report.iter_log_records('nope'))
+    assert excinfo.value.stderr == b"fatal: bad revision 'nope'\n"
+
+
+@mock.patch('giticket.report.subprocess.Popen')
+def test_iter_log_records_closed_early(mock_popen):
+    process = mock_popen.return_value
+    process.stdout.read.side_effect = [b'Ann\x1f2024-01\x1fa\0Bob\x1f2024-01\x1fb\0', b'']
+    process.stderr.read.return_value = b''
+    # git dies of SIGPIPE when the reader stops early.
+    process.returncode = -13
+    records = report.iter_log_records('HEAD')
+    assert next(records) == 'Ann\x1f2024-01\x1fa'
+    records.close()
+    assert process.wait.called
+
+
+@mock.patch('giticket.report.subprocess.Popen')
+def test_report_command_git_error(mock_popen, capsys):
+    process = mock_popen.return_value
+    process.stdout.read.return_value = b''
+    process.stderr.read.return_value = b"fatal: bad revision 'nope'\n"
+    process.returncode = 128
+    assert main(['report', 'nope']) == 1
+    assert capsys.readouterr().err == "GIT LOG FAILED: fatal: bad revision 'nope'\n"
+
+
+@mock.patch('giticket.report.iter_log_records')
+def test_report_command_table(mock_records, capsys):
+    mock_records.return_value = RECORDS
+    assert main(['report', '--by', 'kind']) == 0
+    assert capsys.readouterr().out == (
+        'kind          count\n'
+        'conventional      4\n'
+        'fixup             1\n'
+        'merge             1\n'
+    )
+
+
+@mock.patch('giticket.report.iter_log_records')
+def test_report_command_csv(mock_records, capsys):
+    mock_records.return_value = RECORDS
+    assert main(['report', 'v1..v2', '--by', 'author,month', '--csv']) == 0
+    mock_records.assert_called_once_with('v1..v2')
+    assert capsys.readouterr().out.splitlines() == [
+        'author,month,count',
+        'Ann,2024-01,2',
+        'Bob,2024-02,2',
+        'Ann,2024-02,1',
+        'Bob,2024-03,1',
+    ]
+
+
+@mock.patch('giticket.report.iter_log_records')
+def test_report_command_unused_scopes(mock_records, capsys):
+    mock_records.return_value = RECORDS
+    assert main(['report', '--unused-scopes']) == 0
+    unused = capsys.readouterr().out.splitlines()
+    assert unused == [s for s in ALLOWED_SCOPES if s not in ('CP', 'UI', 'LOR')]
+
+
+def test_column_list():
+    assert report.column_list('type, month') == ['type', 'month']
+    with pytest.raises(argparse.ArgumentTypeError):
+        report.column_list('type,branch')
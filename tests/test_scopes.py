@@ -0,0 +1,259 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import subprocess
+
+import mock
+import pytest
+import six
+
+from giticket import scopes
+from giticket.giticket import ALLOWED_SCOPES
+from giticket.giticket import main
+from giticket.giticket import update_commit_message
+
+TESTING_MODULE = 'giticket.giticket'
+
+SCOPE_MAP = """\
+# path prefix        scope
+src/auth/            auth
+src/auth/sso.py      SET
+src/ui               UI
+src/ui/i18n          I18N
+docs                 DOC
+"""
+
+
+@pytest.fixture
+def trie():
+    return scopes.build_trie(scopes.parse_scope_map(SCOPE_MAP.splitlines()))
+
+
+def test_parse_scope_map():
+    assert scopes.parse_scope_map(SCOPE_MAP.splitlines()) == [
+        ('src/auth/', 'AUTH'),
+        ('src/auth/sso.py', 'SET'),
+        ('src/ui', 'UI'),
+        ('src/ui/i18n', 'I18N'),
+        ('docs', 'DOC'),
+    ]
+
+
+def test_parse_scope_map_invalid_line():
+    with pytest.raises(scopes.ScopeMapError) as excinfo:
+        scopes.parse_scope_map(['docs DOC', 'src/ui'])
+    assert 'line 2' in six.text_type(excinfo.value)
+
+
+def test_parse_scope_map_unknown_scope():
+    assert scopes.parse_scope_map(['lib FOO']) == [('lib', 'FOO')]
+    with pytest.raises(scopes.ScopeMapError) as excinfo:
+        scopes.parse_scope_map(['docs doc', 'lib FOO'], ALLOWED_SCOPES)
+    assert 'line 2' in six.text_type(excinfo.value)
+
+
+@pytest.mark.parametrize('test_data', (
+    ('src/auth/views.py', 'AUTH'),
+    ('src/auth/sso.py', 'SET'),
+    ('src/ui/i18n/en.json', 'I18N'),
+    ('src/ui/button.js', 'UI'),
+    ('src/uikit/button.js', None),
+    ('docs/index.rst', 'DOC'),
+    ('README.rst', None),
+))
+def test_match_path(trie, test_data):
+    path, expected = test_data
+    assert scopes.match_path(trie, path) == expected
+    assert scopes.count_scopes(trie, [path]) == ({expected: 1} if expected else {})
+
+
+def test_infer_scope(trie):
+    assert scopes.infer_scope(trie, []) is None
+    assert scopes.infer_scope(trie, ['README.rst']) is None
+    assert scopes.infer_scope(trie, [
+        'docs/a.rst', 'src/ui/a.js', 'src/ui/b.js', 'src/ui/i18n/fr.json',
+    ]) == 'UI'
+    # Ties resolve alphabetically.
+    assert scopes.infer_scope(trie, ['src/ui/a.js', 'docs/a.rst']) == 'DOC'
+
+
+def test_count_scopes_many_paths(trie):
+    paths = sorted(
+        'src/ui/vendor/pkg{0}/file{1}.js'.format(i // 100, i) for i in range(50000)
+    )
+    with mock.patch('giticket.scopes._components', wraps=scopes._components) as components:
+        assert scopes.count_scopes(trie, paths) == {'UI': 50000}
+    # Each directory is walked once, however many files it holds.
+    assert components.call_count == 500
+
+
+@mock.patch('giticket.scopes.subprocess')
+def test_get_staged_paths(mock_subprocess):
+    mock_subprocess.check_output.return_value = b'a.py\0dir/b c.py\0'
+    assert scopes.get_staged_paths() == ['a.py', 'dir/b c.py']
+    mock_subprocess.check_output.assert_called_once_with(
+        ['git', 'diff', '--cached', '--name-only', '-z'],
+    )
+
+
+@mock.patch('giticket.scopes.subprocess')
+def test_get_staged_paths_not_utf8(mock_subprocess, trie):
+    mock_subprocess.check_output.return_value = b'src/auth/caf\xe9.py\0docs/\xff/a.rst\0'
+    paths = scopes.get_staged_paths()
+    assert len(paths) == 2
+    assert scopes.infer_scope(trie, paths) == 'AUTH'
+
+
+@mock.patch(TESTING_MODULE + '.scopes.subprocess.check_output')
+@mock.patch(TESTING_MODULE + '.get_branch_name')
+def test_update_commit_message_non_utf8_staged_path(mock_branch_name, mock_check_output, tmpdir):
+    mock_branch_name.return_value = 'feature/SP-1234/some-branch-name'
+    mock_check_output.return_value = b'src/auth/caf\xe9.py\0'
+    scope_map = tmpdir.join(scopes.SCOPE_MAP_FILENAME)
+    scope_map.write(SCOPE_MAP)
+    path = tmpdir.join('file.txt')
+    path.write('fix: hello')
+    update_commit_message(six.text_type(path), r'[A-Z]+-\d+',
+                          'regex_match', '{ticket} {commit_msg}',
+                          ['head'], six.text_type(scope_map))
+    assert path.read() == 'fix(AUTH): SP-1234 hello\n'
+
+
+@mock.patch(TESTING_MODULE + '.scopes.subprocess.check_output')
+@mock.patch(TESTING_MODULE + '.get_branch_name')
+def test_update_commit_message_without_git(mock_branch_name, mock_check_output, tmpdir):
+    mock_branch_name.return_value = 'feature/no-ticket'
+    mock_check_output.side_effect = OSError(2, 'No such file or directory: git')
+    scope_map = tmpdir.join(scopes.SCOPE_MAP_FILENAME)
+    scope_map.write(SCOPE_MAP)
+    path = tmpdir.join('file.txt')
+    path.write('fix: hello')
+    assert not update_commit_message(six.text_type(path), r'[A-Z]+-\d+',
+                                     'regex_match', '{ticket} {commit_msg}',
+                                     ['head'], six.text_type(scope_map))
+    assert path.read() == 'fix: hello'
+
+
+@pytest.mark.parametrize('test_data', (
+    ('fix: some message', 'fix(UI): SP-1234 some message\n'),
+    ('FIX: SP-99 already has a ticket', 'fix(UI): SP-99 already has a ticket\n'),
+))
+@mock.patch('giticket.scopes.get_staged_paths')
+@mock.patch(TESTING_MODULE + '.get_branch_name')
+def test_update_commit_message_fills_in_scope(mock_branch_name, mock_staged_paths,
+                                              test_data, tmpdir):
+    msg, expected = test_data
+    mock_branch_name.return_value = 'feature/SP-1234/some-branch-name'
+    mock_staged_paths.return_value = ['src/ui/a.js', 'src/ui/b.js', 'docs/c.rst']
+    scope_map = tmpdir.join(scopes.SCOPE_MAP_FILENAME)
+    scope_map.write(SCOPE_MAP)
+    path = tmpdir.join('file.txt')
+    path.write(msg)
+    assert update_commit_message(six.text_type(path), r'[A-Z]+-\d+',
+                                 'regex_match', '{ticket} {commit_msg}',
+                                 ['head'], six.text_type(scope_map))
+    assert path.read() == expected
+
+
+@mock.patch('giticket.scopes.get_staged_paths')
+@mock.patch(TESTING_MODULE + '.get_branch_name')
+def test_update_commit_message_inferred_scope_counts_as_typed(mock_branch_name,
+                                                              mock_staged_paths, tmpdir):
+    mock_branch_name.return_value = 'feature/SP-1234/some-branch-name'
+    mock_staged_paths.return_value = ['src/ui/a.js']
+    scope_map = tmpdir.join(scopes.SCOPE_MAP_FILENAME)
+    scope_map.write(SCOPE_MAP)
+    # The regex matches the UI scope, as it would in "fix(UI): some message".
+    for msg in ('fix: some message', 'fix(UI): some message'):
+        path = tmpdir.join('file.txt')
+        path.write(msg)
+        update_commit_message(six.text_type(path), r'[A-Z]{2,}',
+                              'regex_match', '{ticket} {commit_msg}',
+                              ['head'], six.text_type(scope_map))
+        assert path.read().rstrip('\n') == 'fix(UI): some message'
+
+
+@mock.patch('giticket.scopes.get_staged_paths')
+@mock.patch(TESTING_MODULE + '.get_branch_name')
+def test_update_commit_message_without_scope_map(mock_branch_name, mock_staged_paths, tmpdir):
+    mock_branch_name.return_value = 'feature/no-ticket'
+    path = tmpdir.join('file.txt')
+    path.write('fix: some message')
+    update_commit_message(six.text_type(path), r'[A-Z]+-\d+',
+                          'regex_match', '{ticket} {commit_msg}',
+                          ['head'], six.text_type(tmpdir.join('missing')))
+    assert path.read() == 'fix: some message'
+    assert not mock_staged_paths.called
+
+
+@mock.patch(TESTING_MODULE + '.sys.stderr.write')
+@mock.patch('giticket.scopes.get_staged_paths')
+@mock.patch(TESTING_MODULE + '.get_branch_name')
+def test_update_commit_message_suggests_staged_scope(mock_branch_name, mock_staged_paths,
+                                                     mock_stderr_write, tmpdir):
+    mock_branch_name.return_value = 'feature/SP-1234/some-branch-name'
+    mock_staged_paths.return_value = ['docs/index.rst']
+    scope_map = tmpdir.join(scopes.SCOPE_MAP_FILENAME)
+    scope_map.write(SCOPE_MAP)
+    path = tmpdir.join('file.txt')
+    path.write('fix(NOPE): some message')
+    with pytest.raises(SystemExit):
+        update_commit_message(six.text_type(path), r'[A-Z]+-\d+',
+                              'regex_match', '{ticket} {commit_msg}',
+                              ['head'], six.text_type(scope_map))
+    mock_stderr_write.assert_any_call("The staged files suggest scope `DOC`.\n")
+
+
+@pytest.mark.parametrize('msg', ('WIP: some message', 'Note: some message'))
+@mock.patch('giticket.scopes.get_staged_paths')
+@mock.patch(TESTING_MODULE + '.get_branch_name')
+def test_update_commit_message_keeps_unknown_type(mock_branch_name, mock_staged_paths,
+                                                  msg, tmpdir):
+    mock_branch_name.return_value = 'feature/no-ticket'
+    mock_staged_paths.return_value = ['src/ui/a.js']
+    scope_map = tmpdir.join(scopes.SCOPE_MAP_FILENAME)
+    scope_map.write(SCOPE_MAP)
+    path = tmpdir.join('file.txt')
+    path.write(msg)
+    assert not update_commit_message(six.text_type(path), r'[A-Z]+-\d+',
+                                     'regex_match', '{ticket} {commit_msg}',
+                                     ['head'], six.text_type(scope_map))
+    assert path.read() == msg
+    assert not mock_staged_paths.called
+
+
+@mock.patch(TESTING_MODULE + '.sys.stderr.write')
+@mock.patch('giticket.scopes.get_staged_paths')
+@mock.patch(TESTING_MODULE + '.get_branch_name')
+def test_update_commit_message_rejects_unknown_map_scope(mock_branch_name, mock_staged_paths,
+                                                         mock_stderr_write, tmpdir):
+    mock_branch_name.return_value = 'feature/SP-1234/some-branch-name'
+    mock_staged_paths.return_value = ['lib/a.py']
+    scope_map = tmpdir.join(scopes.SCOPE_MAP_FILENAME)
+    scope_map.write('lib FOO\n')
+    path = tmpdir.join('file.txt')
+    path.write('fix: some message')
+    with pytest.raises(SystemExit):
+        update_commit_message(six.text_type(path), r'[A-Z]+-\d+',
+                              'regex_match', '{ticket} {commit_msg}',
+                              ['head'], six.text_type(scope_map))
+    assert mock_stderr_write.call_args[0][0].startswith('INVALID SCOPE MAP:')
+    assert path.read() == 'fix: some message'
+
+
+@mock.patch('giticket.scopes.get_staged_paths')
+def test_scope_command(mock_staged_paths, tmpdir, capsys):
+    mock_staged_paths.return_value = ['src/auth/sso.py']
+    scope_map = tmpdir.join(scopes.SCOPE_MAP_FILENAME)
+    scope_map.write(SCOPE_MAP)
+    assert main(['scope', '--scope-map', six.text_type(scope_map)]) == 0
+    assert capsys.readouterr().out == 'SET\n'
+    mock_staged_paths.return_value = ['README.rst']
+    assert main(['scope', '--scope-map', six.text_type(scope_map)]) == 1
+    scope_map.write('lib FOO\n')
+    assert main(['scope', '--scope-map', six.text_type(scope_map)]) == 1
+    assert capsys.readouterr().err.startswith('INVALID SCOPE MAP:')
+    scope_map.write(SCOPE_MAP)
+    mock_staged_paths.side_effect = subprocess.CalledProcessError(128, 'git')
+    assert main(['scope', '--scope-map', six.text_type(scope_map)]) == 1
+    assert capsys.readouterr().err.startswith('NOT A GIT REPOSITORY:')
@@ -0,0 +1,167 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import multiprocessing
+import subprocess
+
+import mock
+import pytest
+import six
+
+from giticket import giticket
+from giticket import stats
+from giticket.giticket import main
+
+TESTING_MODULE = 'giticket.giticket'
+
+
+@pytest.mark.parametrize('test_data', (
+    (0, 0),
+    (0.000001, 0),
+    (0.001, 39),
+    (1.0, 79),
+    (10 ** 6, stats.BUCKET_COUNT - 1),
+))
+def test_bucket_index(test_data):
+    seconds, expected = test_data
+    assert stats.bucket_index(seconds) == expected
+    assert seconds <= stats.bucket_upper_bound(expected) or expected == stats.BUCKET_COUNT - 1
+
+
+def test_histogram_round_trip(tmpdir):
+    path = six.text_type(tmpdir.join(stats.HISTOGRAM_FILENAME))
+    histogram = stats.empty_histogram()
+    histogram[stats.OUTCOME_REWROTE][10] = 3
+    histogram[stats.OUTCOME_REJECTED][127] = 2 ** 40
+    stats.write_histogram(path, histogram)
+    assert tmpdir.join(stats.HISTOGRAM_FILENAME).size() == stats.HISTOGRAM_SIZE
+    assert stats.read_histogram(path) == histogram
+    # No temporary files are left behind by the atomic write.
+    assert tmpdir.listdir() == [tmpdir.join(stats.HISTOGRAM_FILENAME)]
+
+
+def test_read_histogram_ignores_corrupt_file(tmpdir):
+    path = tmpdir.join(stats.HISTOGRAM_FILENAME)
+    path.write_binary(b'garbage')
+    assert stats.read_histogram(six.text_type(path)) == stats.empty_histogram()
+
+
+def test_percentile():
+    buckets = [0] * stats.BUCKET_COUNT
+    assert stats.percentile(buckets, 0.5) is None
+    buckets[40] = 90
+    buckets[60] = 10
+    assert stats.percentile(buckets, 0.5) == stats.bucket_upper_bound(40)
+    assert stats.percentile(buckets, 0.95) == stats.bucket_upper_bound(60)
+
+
+def test_format_stats():
+    histogram = stats.empty_histogram()
+    histogram[stats.OUTCOME_BAILED][40] = 1
+    lines = stats.format_stats(histogram).splitlines()
+    assert lines[0].split() == ['outcome', 'count', 'p50', 'p95', 'p99']
+    assert lines[1].split() == ['bailed', '1', '1.2ms', '1.2ms', '1.2ms']
+    assert lines[2].split() == ['rewrote', '0', '-', '-', '-']
+    assert lines[4].split()[:2] == ['all', '1']
+
+
+@pytest.mark.parametrize('test_data', (
+    ('fixup! something', stats.OUTCOME_BAILED),
+    ('fix(CP): something', stats.OUTCOME_REWROTE),
+    ('fix(NOPE): something', stats.OUTCOME_REJECTED),
+))
+def test_main_records_latency(test_data, tmpdir):
+    msg, outcome = test_data
+    tmpdir.join('HEAD').write('ref: refs/heads/feature/SP-1234/some-branch-name\n')
+    path = tmpdir.join('COMMIT_EDITMSG')
+    path.write(msg)
+    try:
+        main([six.text_type(path), '--mode=regex_match'])
+    except SystemExit:
+        assert outcome == stats.OUTCOME_REJECTED
+    histogram = stats.read_histogram(
+        six.text_type(tmpdir.join(stats.HISTOGRAM_FILENAME)))
+    assert {o: sum(b) for o, b in histogram.items()} == {
+        o: int(o == outcome) for o in stats.OUTCOMES
+    }
+
+
+def test_main_skips_recording_outside_git_dir(tmpdir):
+    path = tmpdir.join('message.txt')
+    path.write('fixup! something')
+    main([six.text_type(path)])
+    assert not tmpdir.join(stats.HISTOGRAM_FILENAME).exists()
+
+
+@mock.patch(TESTING_MODULE + '.update_commit_message')
+def test_main_skips_recording_crashes(mock_update_commit_message, tmpdir):
+    mock_update_commit_message.side_effect = subprocess.CalledProcessError(128, 'git')
+    tmpdir.join('HEAD').write('ref: refs/heads/SP-1_x\n')
+    path = tmpdir.join('COMMIT_EDITMSG')
+    path.write('fix(CP): something')
+    with pytest.raises(subprocess.CalledProcessError):
+        main([six.text_type(path)])
+    assert not tmpdir.join(stats.HISTOGRAM_FILENAME).exists()
+
+
+def _record_many(git_dir):
+    for _ in range(25):
+        stats.record_hook_latency(git_dir, stats.OUTCOME_BAILED, 0.001)
+
+
+def test_record_hook_latency_concurrently(tmpdir):
+    git_dir = six.text_type(tmpdir)
+    processes = [multiprocessing.Process(target=_record_many, args=(git_dir,))
+                 for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    histogram = stats.read_histogram(
+        six.text_type(tmpdir.join(stats.HISTOGRAM_FILENAME)))
+    assert sum(histogram[stats.OUTCOME_BAILED]) == 100
+
+
+@mock.patch('giticket.stats.fcntl', None)
+@mock.patch('giticket.stats.msvcrt')
+def test_record_hook_latency_msvcrt_lock(mock_msvcrt, tmpdir):
+    stats.record_hook_latency(six.text_type(tmpdir), stats.OUTCOME_BAILED, 0.001)
+    histogram = stats.read_histogram(
+        six.text_type(tmpdir.join(stats.HISTOGRAM_FILENAME)))
+    assert sum(histogram[stats.OUTCOME_BAILED]) == 1
+    assert [c[0][1:] for c in mock_msvcrt.locking.call_args_list] == [
+        (mock_msvcrt.LK_LOCK, 1), (mock_msvcrt.LK_UNLCK, 1),
+    ]
+
+
+@mock.patch('giticket.stats.fcntl', None)
+@mock.patch('giticket.stats.msvcrt', None)
+def test_record_hook_latency_without_lock(tmpdir):
+    stats.record_hook_latency(six.text_type(tmpdir), stats.OUTCOME_BAILED, 0.001)
+    assert not tmpdir.join(stats.HISTOGRAM_FILENAME).exists()
+
+
+def test_hook_start_time():
+    with mock.patch(TESTING_MODULE + '._import_time', 5.0):
+        assert giticket.hook_start_time() == 5.0
+        # Later runs in the same process are timed from when they start.
+        assert giticket.hook_start_time() > 5.0
+
+
+@mock.patch('giticket.stats.get_git_dir')
+def test_stats_command(mock_git_dir, tmpdir, capsys):
+    mock_git_dir.return_value = six.text_type(tmpdir)
+    stats.record_hook_latency(six.text_type(tmpdir), stats.OUTCOME_REWROTE, 0.002)
+    assert main(['stats']) == 0
+    out = capsys.readouterr().out
+    assert out.splitlines()[2].split()[:2] == ['rewrote', '1']
+    main(['stats', '--reset'])
+    assert stats.read_histogram(
+        six.text_type(tmpdir.join(stats.HISTOGRAM_FILENAME))) == stats.empty_histogram()
+
+
+@mock.patch('giticket.stats.get_git_dir')
+def test_stats_command_outside_repository(mock_git_dir, capsys):
+    mock_git_dir.side_effect = subprocess.CalledProcessError(128, 'git')
+    assert main(['stats']) == 1
+    assert capsys.readouterr().err.startswith('NOT A GIT REPOSITORY:')